@@ -0,0 +1,388 @@
+"""Mood, Tanglish and topic detection for Nexia.
+
+Every keyword list below is compiled into one word-bounded regex at
+import, so a message is scanned once no matter how many keywords there
+are. Nothing in here touches Streamlit.
+"""
+import re
+import zlib
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime
+
+# Checked in this order; the first mood with a hit wins
+MOOD_KEYWORDS = {
+    'sad': ['sad', 'tired', 'stressed', 'upset', 'aiyo', 'romba tired'],
+    'happy': ['happy', 'excited', 'great', 'awesome', 'super', 'semma'],
+    'angry': ['angry', 'frustrated', 'annoyed'],
+}
+
+TANGLISH_WORDS = [
+    'enaku', 'naku', 'romba', 'konjam', 'pola', 'iruku', 'pannu', 'sollu', 'vaa', 'po', 'illa', 'enna', 'epdi', 'yen', 'aiyo', 'seri', 'ok', 'aama',
+    'da', 'di', 'bro', 'sis', 'machan', 'thala', 'anna', 'akka'
+]
+
+TITLE_CATEGORIES = {
+    'work': {
+        'keywords': ['work', 'job', 'office', 'colleague', 'boss', 'meeting', 'project', 'deadline', 'career', 'interview', 'salary', 'promotion', 'company', 'business', 'professional', 'corporate', 'client', 'presentation', 'report', 'task'],
+        'titles': ['Work Discussion', 'Career Talk', 'Office Life', 'Job Chat', 'Professional Life', 'Work Matters']
+    },
+    'study': {
+        'keywords': ['study', 'exam', 'college', 'school', 'class', 'homework', 'assignment', 'test', 'university', 'course', 'grade', 'professor', 'teacher', 'student', 'education', 'learning', 'book', 'research', 'thesis', 'degree'],
+        'titles': ['Study Session', 'Academic Chat', 'School Talk', 'Learning Journey', 'Education Discussion', 'Study Help']
+    },
+    'emotions': {
+        'sad': {
+            'keywords': ['sad', 'tired', 'stressed', 'upset', 'depressed', 'crying', 'hurt', 'broken', 'aiyo', 'romba tired', 'down', 'low', 'disappointed', 'worried', 'anxious', 'overwhelmed', 'exhausted', 'frustrated'],
+            'titles': ['Support Chat', 'Feeling Down', 'Need Support', 'Tough Times', 'Emotional Support', 'Heart to Heart']
+        },
+        'happy': {
+            'keywords': ['happy', 'excited', 'great', 'awesome', 'amazing', 'wonderful', 'super', 'semma', 'mass', 'fantastic', 'brilliant', 'excellent', 'perfect', 'love', 'joy', 'celebration', 'success'],
+            'titles': ['Good Vibes', 'Happy Moments', 'Celebration Time', 'Great News', 'Positive Energy', 'Joy Chat']
+        },
+        'angry': {
+            'keywords': ['angry', 'mad', 'frustrated', 'annoyed', 'pissed', 'furious', 'irritated', 'rage', 'hate', 'disgusted'],
+            'titles': ['Venting Session', 'Frustrated Talk', 'Need to Vent', 'Anger Management', 'Letting Off Steam', 'Tough Moment']
+        }
+    },
+    'relationships': {
+        'keywords': ['love', 'relationship', 'dating', 'boyfriend', 'girlfriend', 'crush', 'marriage', 'breakup', 'partner', 'romantic', 'valentine', 'anniversary', 'wedding', 'proposal', 'heart', 'feelings'],
+        'titles': ['Love Talk', 'Relationship Chat', 'Dating Discussion', 'Heart Matters', 'Romance Talk', 'Love Life']
+    },
+    'family': {
+        'keywords': ['family', 'mom', 'dad', 'sister', 'brother', 'parents', 'mother', 'father', 'grandmother', 'grandfather', 'uncle', 'aunt', 'cousin', 'home', 'house'],
+        'titles': ['Family Chat', 'Family Time', 'Home Talk', 'Family Matters', 'Family Life', 'Home Sweet Home']
+    },
+    'health': {
+        'keywords': ['health', 'sick', 'doctor', 'medicine', 'hospital', 'pain', 'headache', 'fever', 'cold', 'flu', 'treatment', 'therapy', 'wellness', 'fitness', 'exercise', 'diet'],
+        'titles': ['Health Talk', 'Wellness Chat', 'Health Check', 'Medical Discussion', 'Fitness Journey', 'Health Matters']
+    },
+    'food': {
+        'keywords': ['food', 'eat', 'hungry', 'cook', 'recipe', 'restaurant', 'dinner', 'lunch', 'breakfast', 'meal', 'delicious', 'taste', 'cuisine', 'chef', 'kitchen'],
+        'titles': ['Food Talk', 'Cooking Chat', 'Foodie Discussion', 'Recipe Share', 'Culinary Chat', 'Meal Time']
+    },
+    'travel': {
+        'keywords': ['travel', 'trip', 'vacation', 'flight', 'hotel', 'visit', 'journey', 'adventure', 'explore', 'destination', 'tourist', 'holiday', 'sightseeing'],
+        'titles': ['Travel Plans', 'Adventure Talk', 'Vacation Chat', 'Journey Discussion', 'Travel Stories', 'Wanderlust']
+    },
+    'tech': {
+        'keywords': ['computer', 'phone', 'app', 'software', 'coding', 'programming', 'tech', 'internet', 'website', 'digital', 'ai', 'robot', 'technology', 'gadget'],
+        'titles': ['Tech Talk', 'Digital Chat', 'Tech Help', 'Coding Discussion', 'Gadget Talk', 'Tech World']
+    },
+    'entertainment': {
+        'keywords': ['movie', 'music', 'game', 'book', 'tv', 'show', 'netflix', 'youtube', 'video', 'song', 'artist', 'actor', 'series', 'film', 'concert'],
+        'titles': ['Entertainment Chat', 'Movie Talk', 'Music Discussion', 'Fun Time', 'Media Chat', 'Pop Culture']
+    },
+    'weather': {
+        'keywords': ['weather', 'rain', 'sunny', 'hot', 'cold', 'snow', 'storm', 'climate', 'temperature', 'cloudy', 'wind'],
+        'titles': ['Weather Chat', 'Climate Talk', 'Weather Update', 'Seasonal Chat']
+    },
+    'shopping': {
+        'keywords': ['shopping', 'buy', 'purchase', 'store', 'mall', 'online', 'order', 'delivery', 'price', 'sale', 'discount'],
+        'titles': ['Shopping Talk', 'Purchase Discussion', 'Shopping Spree', 'Deal Hunt']
+    }
+}
+
+STOP_WORDS = {'i', 'am', 'is', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'hi', 'hello', 'hey', 'how', 'what', 'when', 'where', 'why', 'can', 'could', 'would', 'should', 'will', 'do', 'does', 'did', 'have', 'has', 'had', 'be', 'been', 'being'}
+
+TOPIC_WEIGHT = 2
+EMOTION_WEIGHT = 3
+
+
+def _trie_pattern(keywords):
+    # Alternation folded into a prefix trie, so the regex engine follows
+    # one branch per character instead of trying every keyword in turn.
+    # Longer continuations come first, which keeps longest-match-first.
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    # Matches many keyword groups in one regex pass with word boundaries.
+    # A match also counts every keyword nested inside it, so "romba tired"
+    # hits both "romba tired" and "tired" like separate scans would.
+
+    def __init__(self, groups):
+        self.groups = {name: set(words) for name, words in groups.items()}
+        keyword_groups = defaultdict(set)
+        for name, words in self.groups.items():
+            for word in words:
+                keyword_groups[word].add(name)
+        # Longest first so phrases win over the single words inside them
+        keywords = sorted(keyword_groups, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(?:" + _trie_pattern(keywords) + r")\b")
+        self.hits = {}
+        for keyword in keywords:
+            nested = [k for k in keywords if k != keyword and len(k) < len(keyword)
+                      and re.search(r"\b" + re.escape(k) + r"\b", keyword)]
+            self.hits[keyword] = [(name, k) for k in [keyword, *nested] for name in keyword_groups[k]]
+
+    def match(self, text):
+        # Returns {group: {keywords found}}
+        found = defaultdict(set)
+        for keyword in self.pattern.findall(text.lower()):
+            for name, k in self.hits[keyword]:
+                found[name].add(k)
+        return found
+
+    def match_many(self, texts):
+        # Same as match() for each text, but one regex pass over all of them
+        results = [defaultdict(set) for _ in texts]
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        joined = "\n".join(texts).lower()
+        for m in self.pattern.finditer(joined):
+            found = results[bisect_right(starts, m.start()) - 1]
+            for name, k in self.hits[m.group()]:
+                found[name].add(k)
+        return results
+
+
+def _matcher_groups():
+    groups = {f'mood:{mood}': words for mood, words in MOOD_KEYWORDS.items()}
+    groups['tanglish'] = TANGLISH_WORDS
+    for category, data in TITLE_CATEGORIES.items():
+        if category == 'emotions':
+            for emotion, emotion_data in data.items():
+                groups[f'emotion_{emotion}'] = emotion_data['keywords']
+        else:
+            groups[category] = data['keywords']
+    return groups
+
+
+MATCHER = KeywordMatcher(_matcher_groups())
+
+
+def mood_from_hits(found):
+    for mood in MOOD_KEYWORDS:
+        if found.get(f'mood:{mood}'):
+            return mood
+    return 'neutral'
+
+
+def detect_mood(text):
+    return mood_from_hits(MATCHER.match(text))
+
+
+def detect_tanglish(text):
+    return bool(MATCHER.match(text).get('tanglish'))
+
+
+# Checked in this order; a later match overrides an earlier one
+NAME_PATTERNS = [re.compile(p) for p in (r'my name is (\w+)', r'i am (\w+)', r'call me (\w+)')]
+
+
+def extract_user_info(text):
+    info = {}
+    text_lower = text.lower()
+    for pattern in NAME_PATTERNS:
+        match = pattern.search(text_lower)
+        if match:
+            info['name'] = match.group(1).title()
+    return info
+
+
+# Other facts worth remembering across chats: fact -> patterns, last match wins
+PROFILE_PATTERNS = {
+    'location': [re.compile(p) for p in (r"\bi live in ([a-z]+(?: [a-z]+)?)", r"\bi(?: am|'m) from ([a-z]+(?: [a-z]+)?)")],
+    'occupation': [re.compile(p) for p in (r"\bi work as an? ([a-z]+(?: [a-z]+)?)", r"\bi(?: am|'m) studying ([a-z]+(?: [a-z]+)?)")],
+    'likes': [re.compile(p) for p in (r"\bi (?:really )?(?:love|like) ([a-z]+(?: [a-z]+)?)",)],
+}
+
+# Only these say outright that a name follows; "i am X" needs a capital X too
+NAME_INTRO_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (r"\bmy name is ([a-z]+)\b", r"\bcall me ([a-z]+)\b")]
+SELF_INTRO_PATTERN = re.compile(r"\bi(?: am|'m) ([a-z]+)\b", re.IGNORECASE)
+
+# Pronouns and determiners: "i like it" or "i love you" say nothing about the user
+NOT_FACTS = {
+    'i', 'me', 'you', 'he', 'him', 'she', 'her', 'it', 'we', 'us', 'they', 'them', 'this', 'that', 'these',
+    'those', 'my', 'your', 'his', 'its', 'our', 'their', 'a', 'an', 'the', 'some', 'any', 'every', 'all',
+    'no', 'what', 'how', 'when', 'where', 'here', 'there', 'nothing', 'something', 'everything', 'anything',
+}
+
+# "I am Sorry" or "call me later" isn't an introduction, so these never become a saved name
+NOT_NAMES = NOT_FACTS | {
+    'so', 'not', 'very', 'just', 'really', 'also', 'still', 'back', 'fine', 'good', 'ok', 'okay', 'from',
+    'in', 'at', 'going', 'feeling', 'working', 'studying', 'trying', 'doing', 'sure', 'sorry', 'later',
+    'now', 'again', 'tomorrow', 'if', 'maybe', 'nexia',
+    *(word for words in MOOD_KEYWORDS.values() for word in words),
+}
+
+_FACT_TAIL = {'and', 'but', 'now', 'too', 'so', 'also', 'the', 'at', 'in', 'for', 'with', 'to', 'a', 'very'}
+
+
+def extract_profile_facts(text):
+    # Facts saved for good and added to every later prompt, so this is
+    # stricter than extract_user_info: a name needs "my name is" / "call me",
+    # or "i am" followed by a capitalised word as the user typed it
+    facts = {}
+    candidates = [match.group(1) for match in SELF_INTRO_PATTERN.finditer(text) if match.group(1)[0].isupper()]
+    # Explicit introductions last, so they win
+    candidates += [match.group(1) for pattern in NAME_INTRO_PATTERNS for match in pattern.finditer(text)]
+    for name in candidates:
+        if name.lower() not in NOT_NAMES:
+            facts['name'] = name.title()
+    text_lower = text.lower()
+    for fact, patterns in PROFILE_PATTERNS.items():
+        for pattern in patterns:
+            match = pattern.search(text_lower)
+            if match:
+                words = match.group(1).split()
+                while words and words[-1] in _FACT_TAIL:
+                    words.pop()
+                if words and words[0] not in _FACT_TAIL and words[0] not in NOT_FACTS:
+                    facts[fact] = " ".join(words)
+    return facts
+
+
+# Topics before emotions, so ties go the same way as always
+CATEGORY_WEIGHTS = {
+    **{category: TOPIC_WEIGHT for category in TITLE_CATEGORIES if category != 'emotions'},
+    **{f'emotion_{emotion}': EMOTION_WEIGHT for emotion in TITLE_CATEGORIES['emotions']},
+}
+
+
+def score_categories(found):
+    # {category or emotion_<name>: score} using the title weights
+    return {
+        name: weight * len(found[name])
+        for name, weight in CATEGORY_WEIGHTS.items()
+        if found.get(name)
+    }
+
+
+def analyze_messages(texts):
+    # Batch API: mood, Tanglish flag and category scores for each text
+    return [
+        {'mood': mood_from_hits(found), 'tanglish': bool(found.get('tanglish')), 'scores': score_categories(found)}
+        for found in MATCHER.match_many(texts)
+    ]
+
+
+def _pick_title(titles, first_user_message):
+    # Stable choice per chat so the title never flickers between reruns
+    return titles[zlib.crc32(first_user_message.encode()) % len(titles)]
+
+
+def title_from_hits(hits, first_user_message):
+    # `hits` is {category or emotion_<name>: keywords seen}; None if nothing matched
+    scores = score_categories(hits)
+    if not scores:
+        return None
+    top_category = max(scores.keys(), key=lambda k: scores[k])
+    
+    if top_category.startswith('emotion_'):
+        emotion = top_category.split('_')[1]
+        titles = TITLE_CATEGORIES['emotions'][emotion]['titles']
+    else:
+        titles = TITLE_CATEGORIES[top_category]['titles']
+    
+    return _pick_title(titles, first_user_message)
+
+
+def fallback_title(first_user_message):
+    # Extract meaningful words from first message
+    words = [word.strip('.,!?;:"()[]{}') for word in first_user_message.lower().split()]
+    meaningful_words = [word for word in words if word.lower() not in STOP_WORDS and len(word) > 2 and word.isalpha()]
+    
+    if len(meaningful_words) >= 2:
+        return f"{meaningful_words[0].title()} & {meaningful_words[1].title()}"
+    elif len(meaningful_words) == 1:
+        return f"{meaningful_words[0].title()} Chat"
+    else:
+        # Time-based fallback
+        hour = datetime.now().hour
+        if 5 <= hour < 12:
+            return "Morning Chat"
+        elif 12 <= hour < 17:
+            return "Afternoon Chat"
+        elif 17 <= hour < 21:
+            return "Evening Chat"
+        else:
+            return "Night Chat"
+
+
+def merge_hits(hits, found_list):
+    # Folds matcher results into {category: sorted keywords}, the form kept on chats
+    merged = defaultdict(set)
+    for found in found_list:
+        for name in CATEGORY_WEIGHTS:
+            if found.get(name):
+                merged[name] |= found[name]
+    for name, words in merged.items():
+        hits[name] = sorted(words.union(hits.get(name, ())))
+    return hits
+
+
+def match_joined(texts):
+    # Keywords never span a newline, so one match over the joined texts
+    # finds the same hits as matching each text and merging
+    return [MATCHER.match("\n".join(texts))] if texts else []
+
+
+def generate_chat_title_from_conversation(messages):
+    try:
+        if not messages:
+            return "Chat with Nexia"
+        
+        user_messages = [msg['content'] for msg in messages if msg['role'] == 'user']
+        
+        if not user_messages:
+            return "Chat with Nexia"
+        
+        hits = merge_hits({}, match_joined(user_messages))
+        return title_from_hits(hits, user_messages[0]) or fallback_title(user_messages[0])
+            
+    except Exception as e:
+        return "Chat with Nexia"
+
+
+def update_chat_title(chat):
+    # Incremental version of generate_chat_title_from_conversation: only
+    # user messages added since the last call are scanned, and the keyword
+    # hits so far are kept on the chat as `title_state`.
+    try:
+        state = chat.get("title_state") or {"hits": {}, "scored": 0, "first": None, "fallback": None}
+        messages = chat["messages"]
+        if state["scored"] > len(messages):
+            state = {"hits": {}, "scored": 0, "first": None, "fallback": None}
+        
+        new_user_messages = [msg['content'] for msg in messages[state["scored"]:] if msg['role'] == 'user']
+        merge_hits(state["hits"], match_joined(new_user_messages))
+        if state["first"] is None and new_user_messages:
+            state["first"] = new_user_messages[0]
+            state["fallback"] = fallback_title(state["first"])
+        state["scored"] = len(messages)
+        chat["title_state"] = state
+        
+        if state["first"] is None:
+            return "Chat with Nexia"
+        return title_from_hits(state["hits"], state["first"]) or state["fallback"]
+    
+    except Exception as e:
+        return "Chat with Nexia"
+
+
+def refresh_chat_title(chat):
+    # The title to show after a reply: the conversation title when there
+    # is a useful one, otherwise whatever the chat is called now
+    smart_title = update_chat_title(chat)
+    if smart_title and smart_title != "Chat with Nexia" and len(smart_title) > 3:
+        return smart_title
+    return chat["title"]
@@ -1,9 +1,11 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import requests
 import json
 from datetime import datetime
-import re
 import time
+import html
+from contextlib import closing
 
 # Page config
 st.set_page_config(
@@ -69,6 +71,22 @@ def get_theme_css(dark_mode):
                 padding: 12px !important;
                 overflow-y: auto !important;
             }
+            .message-row {
+                display: flex;
+                flex-wrap: wrap;
+                align-items: flex-start;
+                gap: 0.5rem;
+            }
+            .copy-message summary {
+                cursor: pointer;
+                list-style: none;
+            }
+            .copy-message[open] {
+                flex-basis: 100%;
+            }
+            .copy-message pre {
+                white-space: pre-wrap;
+            }
         </style>
         """
     else:
@@ -122,65 +140,128 @@ def get_theme_css(dark_mode):
                 padding: 12px !important;
                 overflow-y: auto !important;
             }
+            .message-row {
+                display: flex;
+                flex-wrap: wrap;
+                align-items: flex-start;
+                gap: 0.5rem;
+            }
+            .copy-message summary {
+                cursor: pointer;
+                list-style: none;
+            }
+            .copy-message[open] {
+                flex-basis: 100%;
+            }
+            .copy-message pre {
+                white-space: pre-wrap;
+            }
         </style>
         """
 
 # Load persistent user database
 import os
-import pickle
+import sqlite3
+import storage
+from groq_client import GROQ_API_URL, GroqClient, iter_model_responses, iter_stream_tokens
+from context import DEFAULT_CONTEXT_BUDGET, MODEL_CONTEXT_BUDGETS, estimate_tokens, fit_context
+from search_index import SearchIndex
+from response_cache import ResponseCache, cache_key
+from model_health import ModelHealth
+from rate_limiter import RateLimiter
+from analysis import detect_mood, detect_tanglish, extract_profile_facts, refresh_chat_title
+from prompts import get_enhanced_system_prompt
+from metrics import Metrics, Turn
+from persistence import WriteBehindQueue, flush_pending
+from user_store import UserStore
+from session_store import SessionStore
+from message_log import MessageLog
+from insights import UserInsights
+from memory import LongTermMemory
+import chat_export
 
-def load_users_db():
-    db_file = "users_db.pkl"
-    if os.path.exists(db_file):
-        try:
-            with open(db_file, 'rb') as f:
-                return pickle.load(f)
-        except:
-            pass
-    return {
-        "demo@nexia.ai": {
-            "password": "demo123",
-            "chats": [],
-            "created_at": datetime.now().isoformat()
-        }
-    }
+def get_setting(name, default):
+    # Optional tuning knobs live in Streamlit secrets next to GROQ_API_KEY
+    try:
+        return st.secrets.get(name, default)
+    except Exception:
+        return default
+
+SESSION_COOKIE = "nexia_sid"
 
-def save_users_db(users_db):
-    db_file = "users_db.pkl"
+@st.cache_resource
+def get_session_store():
+    # The old build kept one global session file that signed every browser in
     try:
-        with open(db_file, 'wb') as f:
-            pickle.dump(users_db, f)
-    except:
+        os.remove("nexia_session.pkl")
+    except OSError:
         pass
-    return users_db
+    return SessionStore(
+        ttl=float(get_setting("SESSION_TTL_HOURS", 24)) * 3600,
+        max_cached=int(get_setting("SESSION_CACHE_SIZE", 10000)),
+        sweep_interval=float(get_setting("SESSION_SWEEP_INTERVAL", 300)),
+        check_interval=float(get_setting("SESSION_CHECK_INTERVAL", 60))
+    )
 
 def load_session():
+    # The token rides in a cookie, so a reload in the same browser stays
+    # signed in. Tokens used to ride in the URL as ?sid=, where pasting a
+    # link signed the other person in; those are dropped, not honoured.
     try:
-        session_file = "nexia_session.pkl"
-        if os.path.exists(session_file):
-            with open(session_file, 'rb') as f:
-                session_data = pickle.load(f)
-                from datetime import timedelta
-                if datetime.now() - datetime.fromisoformat(session_data['timestamp']) < timedelta(hours=24):
-                    return session_data
+        if "sid" in st.query_params:
+            del st.query_params["sid"]
+        token = st.context.cookies.get(SESSION_COOKIE)
+        email = get_session_store().get(token)
+        if email:
+            return {'email': email, 'token': token}
+        if token:
+            st.session_state.session_cookie_stale = True
     except:
         pass
     return None
 
+def write_session_cookie():
+    # Streamlit can't set cookies from Python, so an empty iframe sets
+    # (or, after sign-out, expires) it from the browser
+    token = st.session_state.get("session_token")
+    if token:
+        max_age = int(float(get_setting("SESSION_TTL_HOURS", 24)) * 3600)
+    elif st.session_state.get("session_cookie_stale"):
+        token, max_age = "", 0
+    else:
+        return
+    st.iframe(f"""<script>
+        const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+        window.parent.document.cookie = "{SESSION_COOKIE}={token}; path=/; max-age={max_age}; SameSite=Strict" + secure;
+    </script>""", height="content")
+
 def save_session(email):
     try:
-        session_file = "nexia_session.pkl"
-        session_data = {'email': email, 'timestamp': datetime.now().isoformat()}
-        with open(session_file, 'wb') as f:
-            pickle.dump(session_data, f)
+        token = get_session_store().create(email)
+        st.session_state.session_token = token
+        st.session_state.session_cookie_stale = False
     except:
         pass
 
+def refresh_session():
+    # Any run counts as activity; a token revoked elsewhere signs this tab out
+    token = st.session_state.get("session_token")
+    if token:
+        try:
+            if get_session_store().get(token) is None:
+                st.session_state.authenticated = False
+                st.session_state.user_record = None
+                st.session_state.session_token = None
+                st.session_state.session_cookie_stale = True
+        except:
+            pass
+
 def clear_session():
     try:
-        session_file = "nexia_session.pkl"
-        if os.path.exists(session_file):
-            os.remove(session_file)
+        token = st.session_state.pop("session_token", None)
+        if token:
+            st.session_state.session_cookie_stale = True
+            get_session_store().revoke(token)
     except:
         pass
 
@@ -190,99 +271,50 @@ if 'authenticated' not in st.session_state:
     if saved_session:
         st.session_state.authenticated = True
         st.session_state.user_email = saved_session['email']
+        st.session_state.session_token = saved_session['token']
     else:
         st.session_state.authenticated = False
 if 'user_email' not in st.session_state:
     st.session_state.user_email = ""
 if 'chats' not in st.session_state:
     st.session_state.chats = []
+if 'chat_index' not in st.session_state:
+    st.session_state.chat_index = {}
+if 'search_index' not in st.session_state:
+    st.session_state.search_index = SearchIndex()
+if 'user_record' not in st.session_state:
+    st.session_state.user_record = None
+if 'data_version' not in st.session_state:
+    st.session_state.data_version = 0
+if 'transcript_cache' not in st.session_state:
+    st.session_state.transcript_cache = {}
+if 'transcript_window' not in st.session_state:
+    st.session_state.transcript_window = {}
 if 'active_chat_id' not in st.session_state:
     st.session_state.active_chat_id = None
 if 'dark_mode' not in st.session_state:
     st.session_state.dark_mode = False
 
-if 'users_db' not in st.session_state:
-    st.session_state.users_db = load_users_db()
 if 'current_email' not in st.session_state:
     st.session_state.current_email = ""
 if 'suggested_tab' not in st.session_state:
     st.session_state.suggested_tab = 0  # 0 for Sign In, 1 for Sign Up
-if 'user_profile' not in st.session_state:
-    st.session_state.user_profile = {}
 if 'last_chat_time' not in st.session_state:
     st.session_state.last_chat_time = None
-if 'last_api_call' not in st.session_state:
-    st.session_state.last_api_call = 0
-if 'api_call_count' not in st.session_state:
-    st.session_state.api_call_count = 0
-
-# Smart Nexia Intelligence Functions
-def detect_mood(text):
-    text_lower = text.lower()
-    if any(word in text_lower for word in ['sad', 'tired', 'stressed', 'upset', 'aiyo', 'romba tired']):
-        return 'sad'
-    elif any(word in text_lower for word in ['happy', 'excited', 'great', 'awesome', 'super', 'semma']):
-        return 'happy'
-    elif any(word in text_lower for word in ['angry', 'frustrated', 'annoyed']):
-        return 'angry'
-    return 'neutral'
-
-def extract_user_info(text):
-    info = {}
-    text_lower = text.lower()
-    name_patterns = [r'my name is (\w+)', r'i am (\w+)', r'call me (\w+)']
-    for pattern in name_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            info['name'] = match.group(1).title()
-    return info
-
-def get_enhanced_system_prompt(is_tanglish, user_email, user_mood):
-    base = f"""You are Nexia, an emotionally intelligent AI companion created by Jayashree Murugan 🌟.
-
-PERSONALITY:
-- Warm, caring, and supportive like a close friend
-- Remember user context and past conversations
-- Emotionally intelligent and empathetic
-- Adapt your responses based on user's mood and needs
-
-CURRENT USER: {user_email}
-USER MOOD: {user_mood}
-
-MOOD RESPONSES:
-- If user seems sad: Be extra gentle, offer comfort, acknowledge feelings
-- If user seems happy: Match their energy, celebrate with them
-- If user seems angry: Stay calm, be understanding, help them process
-
-SPECIAL KNOWLEDGE:
-- If asked about Nexia's founder or creator, always say: "Nexia was founded by Jayashree Murugan 🌟"
-
-MEMORY: Reference past conversations naturally when relevant."""
-    
-    if is_tanglish:
-        base += "\n\nLANGUAGE: Respond in natural Tanglish mixing Tamil and English. Use words like: romba, konjam, pola, iruku, enaku, aiyo, seri, machan."
-    else:
-        base += "\n\nLANGUAGE: Respond in warm, friendly English with gentle emojis (💙🙂✨)."
-    
-    return base
 
 # Groq API functions
-def detect_tanglish(text):
-    tanglish_patterns = [
-        r'\b(enaku|naku|romba|konjam|pola|iruku|pannu|sollu|vaa|po|illa|enna|epdi|yen|aiyo|seri|ok|aama)\b',
-        r'\b(da|di|bro|sis|machan|thala|anna|akka)\b'
-    ]
-    return any(re.search(pattern, text, re.IGNORECASE) for pattern in tanglish_patterns)
-
-def check_rate_limit():
-    current_time = time.time()
-    if current_time - st.session_state.last_api_call > 3600:
-        st.session_state.api_call_count = 0
-    if st.session_state.api_call_count >= 30:
-        return False, "Rate limit reached. Please wait before sending another message."
-    if current_time - st.session_state.last_api_call < 2:
-        return False, "Please wait a moment before sending another message."
-    return True, ""
+def check_rate_limit(estimated_tokens):
+    # Shared by every session and process using this API key
+    weights = get_setting("RATE_LIMIT_WEIGHTS", {})
+    allowed, wait, scope = get_rate_limiter().acquire(
+        st.session_state.user_email, estimated_tokens, float(weights.get(st.session_state.user_email, 1))
+    )
+    if allowed:
+        return True, ""
+    wait_seconds = int(wait) + 1
+    if scope == "user":
+        return False, f"You're sending messages quickly. Please wait {wait_seconds} seconds before sending another message."
+    return False, f"Lots of people are chatting with Nexia right now. Please try again in {wait_seconds} seconds."
 
 def get_fallback_response(user_message, user_mood):
     is_tanglish = detect_tanglish(user_message)
@@ -307,30 +339,124 @@ def get_fallback_response(user_message, user_mood):
     lang = 'tanglish' if is_tanglish else 'english'
     return responses[user_mood][lang]
 
-def send_message_to_groq(messages, user_message):
+MAX_REPLY_TOKENS = 500
+
+@st.cache_resource
+def get_groq_client():
+    # Shared by every session in this server process so connections are reused
+    return GroqClient(
+        pool_size=int(get_setting("GROQ_POOL_SIZE", 10)),
+        connect_timeout=float(get_setting("GROQ_CONNECT_TIMEOUT", 5)),
+        read_timeout=float(get_setting("GROQ_READ_TIMEOUT", 30))
+    )
+
+@st.cache_resource
+def get_model_health():
+    # Breakers are per process, so one throttled model is skipped for everyone
+    return ModelHealth(
+        cooldown=float(get_setting("MODEL_BREAKER_COOLDOWN", 15)),
+        max_cooldown=float(get_setting("MODEL_BREAKER_MAX_COOLDOWN", 300))
+    )
+
+def is_admin():
+    return st.session_state.user_email in get_setting("ADMIN_EMAILS", [])
+
+@st.cache_resource
+def get_rate_limiter():
+    return RateLimiter(
+        rpm=int(get_setting("GROQ_RPM", 30)),
+        tpm=int(get_setting("GROQ_TPM", 6000)),
+        user_rpm=int(get_setting("RATE_LIMIT_USER_RPM", 10))
+    )
+
+@st.cache_resource
+def get_write_queue():
+    # One background writer per process; chat saves return once queued
+    return WriteBehindQueue(
+        max_pending=int(get_setting("WRITE_QUEUE_MAX_PENDING", 1000)),
+        interval=float(get_setting("WRITE_FLUSH_INTERVAL", 0.5))
+    )
+
+@st.cache_resource
+def get_user_store():
+    # One copy of each signed-in user's chats, shared by all their sessions
+    return UserStore(
+        load_user_data,
+        max_users=int(get_setting("USER_STORE_MAX_USERS", 1000)),
+        is_stale=user_record_is_stale,
+        check_interval=float(get_setting("USER_STORE_CHECK_INTERVAL", 5))
+    )
+
+@st.cache_resource
+def get_metrics():
+    # Stage timings for every turn in this process; files are optional
+    return Metrics(
+        prom_path=get_setting("METRICS_PROM_FILE", "") or None,
+        log_path=get_setting("METRICS_LOG_FILE", "") or None,
+        prom_interval=float(get_setting("METRICS_PROM_INTERVAL", 10))
+    )
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(
+        max_entries=int(get_setting("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+        max_bytes=int(get_setting("RESPONSE_CACHE_MAX_BYTES", 1_000_000)),
+        ttl=float(get_setting("RESPONSE_CACHE_TTL", 3600))
+    )
+
+def get_cache_history(messages, user_message):
+    # Only short, context-free turns are cached; returns the history part
+    # of the cache key, or None when this turn should go to the API
+    if not get_setting("RESPONSE_CACHE", False):
+        return None
+    max_history = int(get_setting("RESPONSE_CACHE_MAX_HISTORY", 0))
+    if len(messages) > max_history or len(user_message) > int(get_setting("RESPONSE_CACHE_MAX_CHARS", 40)):
+        return None
+    return list(messages[-max_history:]) if max_history else []
+
+def recall_memories(user_message, chat):
+    # Learns any profile facts in the message, then picks snippets from the
+    # user's other chats that fit MEMORY_TOKEN_BUDGET
+    record = st.session_state.user_record
+    if record is None:
+        return [], {}
+    with record.lock:
+        changed = record.memory.update_facts(extract_profile_facts(user_message))
+        if changed:
+            get_write_queue().save_facts(st.session_state.user_email, changed)
+        memories = record.memory.recall(
+            user_message,
+            k=int(get_setting("MEMORY_TOP_K", 3)),
+            budget=int(get_setting("MEMORY_TOKEN_BUDGET", 300)),
+            exclude_chat=chat["id"] if chat is not None else None
+        )
+        return memories, dict(record.memory.facts)
+
+def send_message_to_groq(messages, user_message, on_token=None, chat=None, turn=None):
+    # With on_token set the reply is streamed and on_token gets the text so far.
+    # With chat set its rolling summary is used and updated to trim the history.
+    # With turn set, stage timings and request details are recorded on it.
+    if turn is None:
+        turn = Turn()
     try:
-        can_call, limit_msg = check_rate_limit()
-        if not can_call:
-            user_mood = detect_mood(user_message)
-            return get_fallback_response(user_message, user_mood) + f"\n\n⚠️ {limit_msg}"
-        
         if "GROQ_API_KEY" in st.secrets:
             api_key = st.secrets["GROQ_API_KEY"]
         else:
             st.error("API key not found in secrets. Please add GROQ_API_KEY to Streamlit secrets.")
+            turn.attrs["status"] = "no_api_key"
             return "Please configure API key in Streamlit secrets."
         
-        is_tanglish = detect_tanglish(user_message)
-        user_mood = detect_mood(user_message)
-        user_info = extract_user_info(user_message)
-        
-        if user_info:
-            st.session_state.user_profile.update(user_info)
-        
-        system_prompt = get_enhanced_system_prompt(is_tanglish, st.session_state.user_email, user_mood)
-        
-        if st.session_state.user_profile.get('name'):
-            system_prompt += f"\n\nUSER NAME: {st.session_state.user_profile['name']}"
+        cache_history = get_cache_history(messages, user_message)
+        with turn.span("prompt"):
+            is_tanglish = detect_tanglish(user_message)
+            user_mood = detect_mood(user_message)
+            memories, facts = recall_memories(user_message, chat)
+            if cache_history is None:
+                system_prompt = get_enhanced_system_prompt(is_tanglish, st.session_state.user_email, user_mood, facts, memories)
+            else:
+                # Cacheable openers get a prompt with nothing about this user
+                # in it, so the same opener from anyone shares one reply
+                system_prompt = get_enhanced_system_prompt(is_tanglish, None, user_mood)
         
         headers = {
             "Authorization": f"Bearer {api_key}",
@@ -339,187 +465,161 @@ def send_message_to_groq(messages, user_message):
         
         models = ["llama-3.1-8b-instant", "llama-3.2-3b-preview", "gemma2-9b-it"]
         
-        for model in models:
+        if cache_history is not None:
+            with turn.span("cache_lookup"):
+                cached = get_response_cache().get(cache_key(system_prompt, cache_history, user_message))
+            if cached is not None:
+                turn.attrs["status"] = "cache_hit"
+                if on_token:
+                    on_token(cached)
+                return cached
+        
+        stream = on_token is not None
+        stream_failed = False
+        budgets = {**MODEL_CONTEXT_BUDGETS, **get_setting("GROQ_CONTEXT_BUDGETS", {})}
+        # Each model's window moves the summary differently; only the one
+        # from the model that answers is kept on the chat
+        summaries = {}
+        
+        def build_payload(model):
+            started = time.perf_counter()
+            history, summaries[model] = fit_context(
+                messages, int(budgets.get(model, DEFAULT_CONTEXT_BUDGET)),
+                chat.get("context_summary") if chat is not None else None
+            )
             payload = {
                 "model": model,
                 "messages": [
                     {"role": "system", "content": system_prompt},
-                    *messages,
+                    *history,
                     {"role": "user", "content": user_message}
                 ],
                 "temperature": 0.8,
-                "max_tokens": 500
+                "max_tokens": MAX_REPLY_TOKENS,
+                "stream": stream
             }
-            
-            response = requests.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            
-            st.session_state.last_api_call = time.time()
-            st.session_state.api_call_count += 1
-            
-            if response.status_code == 200:
-                st.session_state.last_chat_time = datetime.now().isoformat()
-                return response.json()["choices"][0]["message"]["content"]
-            elif response.status_code == 429:
-                continue
-            else:
-                break
+            turn.attrs["payload_bytes"] = len(json.dumps(payload).encode("utf-8"))
+            turn.add("context", time.perf_counter() - started)
+            return payload
+        
+        def estimate_request(payload):
+            return sum(estimate_tokens(m["content"]) for m in payload["messages"]) + MAX_REPLY_TOKENS
+        
+        # Cache hits above don't use the API, so they skip the rate limit
+        estimated_tokens = estimate_request(build_payload(models[0]))
+        with turn.span("rate_limit"):
+            can_call, limit_msg = check_rate_limit(estimated_tokens)
+        if not can_call:
+            turn.attrs["status"] = "rate_limited"
+            return get_fallback_response(user_message, user_mood) + f"\n\n⚠️ {limit_msg}"
+        
+        # The first request was paid for above; every fallback or hedge after
+        # it takes its own request from the limiter, or isn't sent
+        first_request = [True]
         
-        if response.status_code == 429:
-            return get_fallback_response(user_message, user_mood) + "\n\n⚠️ I'm experiencing high traffic right now. Please try again in a few minutes!"
+        def acquire_request(model, payload):
+            if first_request[0]:
+                first_request[0] = False
+                return True
+            with turn.span("rate_limit"):
+                return check_rate_limit(estimate_request(payload))[0]
+        
+        # With GROQ_HEDGE_DELAY set, a slow model gets raced by the next one
+        hedge_delay = float(get_setting("GROQ_HEDGE_DELAY", 0))
+        deadline = get_setting("GROQ_DEADLINE", None)
+        attempts = iter_model_responses(
+            get_groq_client(), get_setting("GROQ_API_URL", GROQ_API_URL), models, build_payload,
+            stream=stream, hedge_delay=hedge_delay,
+            deadline=float(deadline) if deadline else None,
+            health=get_model_health(),
+            acquire=acquire_request,
+            headers=headers
+        )
+        response = None
+        with closing(attempts):
+            waiting = time.perf_counter()
+            for model, response in attempts:
+                turn.add("groq_request", time.perf_counter() - waiting)
+                if turn.attrs["model"] is not None:
+                    turn.attrs["retries"] += 1
+                turn.attrs.update(model=model, status=response.status_code)
+                if response.status_code == 200:
+                    st.session_state.last_chat_time = datetime.now().isoformat()
+                    if not stream:
+                        with turn.span("groq_read"):
+                            data = response.json()
+                        text = data["choices"][0]["message"]["content"]
+                        turn.usage = data.get("usage") or {}
+                        if turn.usage.get("total_tokens"):
+                            get_rate_limiter().settle(estimated_tokens, turn.usage["total_tokens"])
+                        if chat is not None:
+                            chat["context_summary"] = summaries[model]
+                        if cache_history is not None:
+                            get_response_cache().put(cache_key(system_prompt, cache_history, user_message), text)
+                        return text
+                
+                    text = ""
+                    usage = {}
+                    try:
+                        with turn.span("groq_stream"):
+                            for token in iter_stream_tokens(response, usage):
+                                if not text:
+                                    turn.add("first_token", time.perf_counter() - turn.started)
+                                text += token
+                                on_token(text)
+                    except (requests.exceptions.RequestException, ValueError, KeyError, IndexError):
+                        text = ""
+                    finally:
+                        response.close()
+                    if text:
+                        turn.usage = usage
+                        if usage.get("total_tokens"):
+                            get_rate_limiter().settle(estimated_tokens, usage["total_tokens"])
+                        if chat is not None:
+                            chat["context_summary"] = summaries[model]
+                        if cache_history is not None:
+                            get_response_cache().put(cache_key(system_prompt, cache_history, user_message), text)
+                        return text
+                    # Stream broke partway or came back empty, so move on to the next model
+                    get_model_health().record_failure(model)
+                    stream_failed = True
+                    turn.attrs["status"] = "stream_failed"
+                    waiting = time.perf_counter()
+                    continue
+                elif response.status_code == 429:
+                    response.close()
+                    waiting = time.perf_counter()
+                    continue
+                else:
+                    response.close()
+                    break
+        
+        if response is None:
+            # Every model's breaker is open, so don't even try
+            turn.attrs["status"] = "breaker_open"
+            wait_seconds = int(get_model_health().retry_in(models)) + 1
+            return get_fallback_response(user_message, user_mood) + f"\n\n⚠️ I'm experiencing high traffic right now. Please try again in {wait_seconds} seconds!"
+        elif stream_failed and response.status_code == 200:
+            return get_fallback_response(user_message, user_mood) + "\n\n⚠️ Connection issue. Please check your internet and try again."
+        elif response.status_code == 429:
+            # Breakers opened on Retry-After, so they know the real wait
+            wait_seconds = int(get_model_health().retry_in(models)) + 1
+            return get_fallback_response(user_message, user_mood) + f"\n\n⚠️ I'm experiencing high traffic right now. Please try again in {wait_seconds} seconds!"
         else:
             return get_fallback_response(user_message, user_mood) + f"\n\n⚠️ Technical issue (Error {response.status_code}). I'm still here to chat though!"
             
     except requests.exceptions.RequestException as e:
+        turn.attrs["status"] = "connection_error"
         user_mood = detect_mood(user_message)
         return get_fallback_response(user_message, user_mood) + "\n\n⚠️ Connection issue. Please check your internet and try again."
     except Exception as e:
+        turn.attrs["status"] = "error"
         user_mood = detect_mood(user_message)
         return get_fallback_response(user_message, user_mood) + "\n\n⚠️ Something went wrong, but I'm still here for you!"
 
-def generate_chat_title_from_conversation(messages):
-    try:
-        if not messages:
-            return "Chat with Nexia"
-        
-        all_text = ""
-        user_messages = []
-        
-        for msg in messages:
-            if msg['role'] == 'user':
-                user_messages.append(msg['content'].lower())
-                all_text += msg['content'].lower() + " "
-        
-        if not user_messages:
-            return "Chat with Nexia"
-        
-        # Enhanced categories with more keywords and better detection
-        categories = {
-            'work': {
-                'keywords': ['work', 'job', 'office', 'colleague', 'boss', 'meeting', 'project', 'deadline', 'career', 'interview', 'salary', 'promotion', 'company', 'business', 'professional', 'corporate', 'client', 'presentation', 'report', 'task'],
-                'titles': ['Work Discussion', 'Career Talk', 'Office Life', 'Job Chat', 'Professional Life', 'Work Matters']
-            },
-            'study': {
-                'keywords': ['study', 'exam', 'college', 'school', 'class', 'homework', 'assignment', 'test', 'university', 'course', 'grade', 'professor', 'teacher', 'student', 'education', 'learning', 'book', 'research', 'thesis', 'degree'],
-                'titles': ['Study Session', 'Academic Chat', 'School Talk', 'Learning Journey', 'Education Discussion', 'Study Help']
-            },
-            'emotions': {
-                'sad': {
-                    'keywords': ['sad', 'tired', 'stressed', 'upset', 'depressed', 'crying', 'hurt', 'broken', 'aiyo', 'romba tired', 'down', 'low', 'disappointed', 'worried', 'anxious', 'overwhelmed', 'exhausted', 'frustrated'],
-                    'titles': ['Support Chat', 'Feeling Down', 'Need Support', 'Tough Times', 'Emotional Support', 'Heart to Heart']
-                },
-                'happy': {
-                    'keywords': ['happy', 'excited', 'great', 'awesome', 'amazing', 'wonderful', 'super', 'semma', 'mass', 'fantastic', 'brilliant', 'excellent', 'perfect', 'love', 'joy', 'celebration', 'success'],
-                    'titles': ['Good Vibes', 'Happy Moments', 'Celebration Time', 'Great News', 'Positive Energy', 'Joy Chat']
-                },
-                'angry': {
-                    'keywords': ['angry', 'mad', 'frustrated', 'annoyed', 'pissed', 'furious', 'irritated', 'rage', 'hate', 'disgusted'],
-                    'titles': ['Venting Session', 'Frustrated Talk', 'Need to Vent', 'Anger Management', 'Letting Off Steam', 'Tough Moment']
-                }
-            },
-            'relationships': {
-                'keywords': ['love', 'relationship', 'dating', 'boyfriend', 'girlfriend', 'crush', 'marriage', 'breakup', 'partner', 'romantic', 'valentine', 'anniversary', 'wedding', 'proposal', 'heart', 'feelings'],
-                'titles': ['Love Talk', 'Relationship Chat', 'Dating Discussion', 'Heart Matters', 'Romance Talk', 'Love Life']
-            },
-            'family': {
-                'keywords': ['family', 'mom', 'dad', 'sister', 'brother', 'parents', 'mother', 'father', 'grandmother', 'grandfather', 'uncle', 'aunt', 'cousin', 'home', 'house'],
-                'titles': ['Family Chat', 'Family Time', 'Home Talk', 'Family Matters', 'Family Life', 'Home Sweet Home']
-            },
-            'health': {
-                'keywords': ['health', 'sick', 'doctor', 'medicine', 'hospital', 'pain', 'headache', 'fever', 'cold', 'flu', 'treatment', 'therapy', 'wellness', 'fitness', 'exercise', 'diet'],
-                'titles': ['Health Talk', 'Wellness Chat', 'Health Check', 'Medical Discussion', 'Fitness Journey', 'Health Matters']
-            },
-            'food': {
-                'keywords': ['food', 'eat', 'hungry', 'cook', 'recipe', 'restaurant', 'dinner', 'lunch', 'breakfast', 'meal', 'delicious', 'taste', 'cuisine', 'chef', 'kitchen'],
-                'titles': ['Food Talk', 'Cooking Chat', 'Foodie Discussion', 'Recipe Share', 'Culinary Chat', 'Meal Time']
-            },
-            'travel': {
-                'keywords': ['travel', 'trip', 'vacation', 'flight', 'hotel', 'visit', 'journey', 'adventure', 'explore', 'destination', 'tourist', 'holiday', 'sightseeing'],
-                'titles': ['Travel Plans', 'Adventure Talk', 'Vacation Chat', 'Journey Discussion', 'Travel Stories', 'Wanderlust']
-            },
-            'tech': {
-                'keywords': ['computer', 'phone', 'app', 'software', 'coding', 'programming', 'tech', 'internet', 'website', 'digital', 'ai', 'robot', 'technology', 'gadget'],
-                'titles': ['Tech Talk', 'Digital Chat', 'Tech Help', 'Coding Discussion', 'Gadget Talk', 'Tech World']
-            },
-            'entertainment': {
-                'keywords': ['movie', 'music', 'game', 'book', 'tv', 'show', 'netflix', 'youtube', 'video', 'song', 'artist', 'actor', 'series', 'film', 'concert'],
-                'titles': ['Entertainment Chat', 'Movie Talk', 'Music Discussion', 'Fun Time', 'Media Chat', 'Pop Culture']
-            },
-            'weather': {
-                'keywords': ['weather', 'rain', 'sunny', 'hot', 'cold', 'snow', 'storm', 'climate', 'temperature', 'cloudy', 'wind'],
-                'titles': ['Weather Chat', 'Climate Talk', 'Weather Update', 'Seasonal Chat']
-            },
-            'shopping': {
-                'keywords': ['shopping', 'buy', 'purchase', 'store', 'mall', 'online', 'order', 'delivery', 'price', 'sale', 'discount'],
-                'titles': ['Shopping Talk', 'Purchase Discussion', 'Shopping Spree', 'Deal Hunt']
-            }
-        }
-        
-        # Calculate scores with weighted importance
-        scores = {}
-        
-        # Check regular categories
-        for category, data in categories.items():
-            if category == 'emotions':
-                continue
-            
-            score = sum(2 if keyword in all_text else 0 for keyword in data['keywords'])
-            if score > 0:
-                scores[category] = score
-        
-        # Check emotional categories with higher weight
-        for emotion, data in categories['emotions'].items():
-            score = sum(3 if keyword in all_text else 0 for keyword in data['keywords'])
-            if score > 0:
-                scores[f'emotion_{emotion}'] = score
-        
-        # If we found matching categories, use the highest scoring one
-        if scores:
-            top_category = max(scores.keys(), key=lambda k: scores[k])
-            
-            if top_category.startswith('emotion_'):
-                emotion = top_category.split('_')[1]
-                titles = categories['emotions'][emotion]['titles']
-            else:
-                titles = categories[top_category]['titles']
-            
-            import random
-            return random.choice(titles)
-        
-        # Fallback: Extract meaningful words from first message
-        first_msg = user_messages[0]
-        stop_words = {'i', 'am', 'is', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'hi', 'hello', 'hey', 'how', 'what', 'when', 'where', 'why', 'can', 'could', 'would', 'should', 'will', 'do', 'does', 'did', 'have', 'has', 'had', 'be', 'been', 'being'}
-        
-        # Clean and extract meaningful words
-        words = [word.strip('.,!?;:"()[]{}') for word in first_msg.split()]
-        meaningful_words = [word for word in words if word.lower() not in stop_words and len(word) > 2 and word.isalpha()]
-        
-        if len(meaningful_words) >= 2:
-            return f"{meaningful_words[0].title()} & {meaningful_words[1].title()}"
-        elif len(meaningful_words) == 1:
-            return f"{meaningful_words[0].title()} Chat"
-        else:
-            # Time-based fallback
-            hour = datetime.now().hour
-            if 5 <= hour < 12:
-                return "Morning Chat"
-            elif 12 <= hour < 17:
-                return "Afternoon Chat"
-            elif 17 <= hour < 21:
-                return "Evening Chat"
-            else:
-                return "Night Chat"
-            
-    except Exception as e:
-        return "Chat with Nexia"
-
 def check_email_exists(email):
     if email and "@" in email:
-        if email in st.session_state.users_db or email == "demo@nexia.ai":
+        if email == "demo@nexia.ai" or storage.get_user(email) is not None:
             st.session_state.suggested_tab = 0
             return True, "Email found! Please sign in."
         else:
@@ -530,88 +630,354 @@ def check_email_exists(email):
 def authenticate_user(email, password):
     if email == "demo@nexia.ai" and password == "demo123":
         return True
-    if email in st.session_state.users_db:
-        return st.session_state.users_db[email]["password"] == password
+    user = storage.get_user(email)
+    if user is not None:
+        return user["password"] == password
     return False
 
 def register_user(email, password):
     if email and len(password) >= 6:
-        if email in st.session_state.users_db:
+        if not storage.create_user(email, password):
             return False, "Email already exists! Please go to Sign In."
-        
-        st.session_state.users_db[email] = {
-            "password": password,
-            "chats": [],
-            "created_at": datetime.now().isoformat()
-        }
-        save_users_db(st.session_state.users_db)
         return True, "Account created successfully!"
     return False, "Invalid email or password too short"
 
-def load_user_chats(email):
-    if email in st.session_state.users_db:
-        return st.session_state.users_db[email].get("chats", [])
-    return []
+def load_user_data(email):
+    # Queued writes from this or another session must land before reading back
+    flush_pending(email)
+    chats = storage.load_chats(email)
+    data = storage.load_insights(email)
+    if data is None:
+        # Users from before the rollups get them built once from their stored
+        # chats; if another process got there first, its rollups are kept
+        data = storage.init_insights(email, UserInsights.from_chats(chats).to_bytes())
+    insights = UserInsights.from_bytes(data)
+    memory = LongTermMemory.from_chats(chats, storage.load_profile_facts(email))
+    return chats, SearchIndex(storage.load_search_terms(email)), insights, memory
 
-def save_user_chats(email, chats):
-    if email in st.session_state.users_db:
-        st.session_state.users_db[email]["chats"] = chats
-        save_users_db(st.session_state.users_db)
+def user_record_is_stale(record):
+    # Another process changed this user's chats if the stored counts differ
+    # from what this process has saved. A turn in flight has appended
+    # messages that aren't saved yet, so those are compared by each chat's
+    # message_count rather than its length, and chats never handed to the
+    # writer don't count. Queued writes would differ too, so wait for them.
+    if get_write_queue().pending(record.email):
+        return False
+    with record.lock:
+        saved = [chat["message_count"] for chat in record.chats if "message_count" in chat]
+    return tuple(storage.chat_counts(record.email)) != (len(saved), sum(saved))
+
+def sync_user_data():
+    # Points this session at the shared record for its user. A newer version
+    # means some session changed it: take the current chat list and drop
+    # state about chats that are gone.
+    record = get_user_store().get(st.session_state.user_email)
+    if record is st.session_state.user_record and record.version == st.session_state.data_version:
+        return record
+    if record is not st.session_state.user_record:
+        # A reloaded record may order messages differently from what was drawn
+        st.session_state.transcript_cache = {}
+    with record.lock:
+        st.session_state.user_record = record
+        st.session_state.data_version = record.version
+        st.session_state.chats = record.chats
+        st.session_state.chat_index = record.chat_index
+        st.session_state.search_index = record.search_index
+    if st.session_state.active_chat_id not in record.chat_index:
+        st.session_state.active_chat_id = st.session_state.chats[0]["id"] if st.session_state.chats else None
+    for chat_id in [c for c in st.session_state.transcript_cache if c not in record.chat_index]:
+        del st.session_state.transcript_cache[chat_id]
+    return record
+
+def save_user_chat(email, chat):
+    # Queued; the writer only stores the chat row and messages appended since the last save
+    get_write_queue().save_chat(email, chat)
 
 def create_new_chat():
-    user_chats = load_user_chats(st.session_state.user_email)
-    new_chat = {
-        "id": len(user_chats) + 1,
-        "title": "New Chat",
-        "messages": [],
-        "created_at": datetime.now().isoformat()
-    }
-    user_chats.insert(0, new_chat)
-    st.session_state.chats = user_chats
+    record = st.session_state.user_record
+    with record.lock:
+        new_chat = {
+            "id": record.new_chat_id(),
+            "title": "New Chat",
+            "messages": MessageLog(),
+            "created_at": datetime.now().isoformat()
+        }
+        record.add_chat(new_chat)
+        st.session_state.chats = record.chats
     st.session_state.active_chat_id = new_chat["id"]
-    save_user_chats(st.session_state.user_email, user_chats)
+    save_user_chat(st.session_state.user_email, new_chat)
     return new_chat
 
 def delete_chat(chat_id):
-    st.session_state.chats = [chat for chat in st.session_state.chats if chat["id"] != chat_id]
+    record = st.session_state.user_record
+    with record.lock:
+        record.remove_chat(chat_id)
+        st.session_state.chats = record.chats
     if st.session_state.active_chat_id == chat_id:
         st.session_state.active_chat_id = st.session_state.chats[0]["id"] if st.session_state.chats else None
-    save_user_chats(st.session_state.user_email, st.session_state.chats)
+    st.session_state.transcript_cache.pop(chat_id, None)
+    get_write_queue().delete_chat(st.session_state.user_email, chat_id)
 
 def clear_all_chats():
-    st.session_state.chats = []
+    record = st.session_state.user_record
+    with record.lock:
+        record.clear()
+        st.session_state.chats = record.chats
     st.session_state.active_chat_id = None
-    save_user_chats(st.session_state.user_email, [])
+    st.session_state.transcript_cache = {}
+    get_write_queue().delete_all_chats(st.session_state.user_email)
+
+def export_user_chats(email, compress):
+    # Runs on Streamlit's download thread, so it takes the email instead of reading session state
+    flush_pending(email)
+    return chat_export.export_file(email, compress)
+
+def import_user_chats(uploaded):
+    # Streams the file in, one transaction per batch of chats; batches
+    # written before a bad line stay imported
+    email = st.session_state.user_email
+    record = st.session_state.user_record
+    imported = 0
+    try:
+        for batch in chat_export.batched(chat_export.read_chats(uploaded, record.new_chat_id), chat_export.IMPORT_BATCH):
+            storage.apply_writes([("save_chat", email, chat) for chat in batch])
+            for chat in batch:
+                chat["message_count"] = len(chat["messages"])
+            record.add_chats(batch)
+            imported += len(batch)
+        error = None
+    except (ValueError, OSError, EOFError, sqlite3.Error) as e:
+        error = str(e)
+    if imported:
+        get_write_queue().save_insights(email, record.take_unsaved_insights())
+    return imported, error
 
 def search_chats(query):
     if not query:
         return st.session_state.chats, {}
+    # The index and chats are shared with the user's other sessions, which
+    # change them under the record's lock
+    with st.session_state.user_record.lock:
+        return st.session_state.search_index.search(query, st.session_state.chats, st.session_state.chat_index)
+
+# Transcript rendering: the visible window goes out as one HTML block
+def text_html(text):
+    return html.escape(text).replace("\r", "").replace("\n", "<br>")
+
+def message_html(message, query=""):
+    highlight_class = ""
+    if query:
+        # Split before escaping so the query can only match the user's text, never the markup
+        highlight_class = " search-highlight"
+        mark = f'<mark style="background-color: yellow; color: black;">{text_html(query)}</mark>'
+        content = mark.join(text_html(part) for part in message["content"].split(query))
+    else:
+        content = text_html(message["content"])
+    if message["role"] == "user":
+        bubble = f'<div class="chat-message user-message{highlight_class}">{content}</div>'
+    else:
+        bubble = f'<div class="chat-message assistant-message{highlight_class}">🤖 {content}</div>'
+    # Newlines as &#10; keep the transcript one HTML block; a blank line would
+    # end it and hand the rest to the Markdown parser
+    copy_text = html.escape(message["content"]).replace("\r", "").replace("\n", "&#10;")
+    copy = f'<details class="copy-message"><summary>📋</summary><pre>{copy_text}</pre></details>'
+    return f'<div class="message-row">{bubble}{copy}</div>'
+
+def get_transcript_parts(chat):
+    # Per-chat cache of rendered messages, extended as messages are appended
+    parts = st.session_state.transcript_cache.get(chat["id"])
+    if parts is None or len(parts) > len(chat["messages"]):
+        parts = []
+        st.session_state.transcript_cache[chat["id"]] = parts
+    for message in chat["messages"][len(parts):]:
+        parts.append(message_html(message))
+    return parts
+
+def render_transcript(chat, search_query="", highlight_indices=()):
+    page = int(get_setting("TRANSCRIPT_WINDOW", 40))
+    parts = get_transcript_parts(chat)
+    window = st.session_state.transcript_window.get(chat["id"], page)
+    start = max(0, len(parts) - window)
+    if highlight_indices:
+        # Keep search hits visible even when they are older than the window
+        start = min(start, min(highlight_indices))
     
-    query_lower = query.lower()
-    filtered_chats = []
-    search_highlights = {}
+    if start > 0:
+        if st.button(f"⬆️ Load earlier messages ({start} hidden)", key=f"load_earlier_{chat['id']}"):
+            st.session_state.transcript_window[chat["id"]] = len(parts) - start + page
+            st.rerun()
     
-    for chat in st.session_state.chats:
-        matching_messages = []
-        
-        # Search in title
-        title_match = query_lower in chat['title'].lower()
+    highlighted = set(highlight_indices)
+    visible = [
+        message_html(chat["messages"][i], search_query) if i in highlighted else parts[i]
+        for i in range(start, len(parts))
+    ]
+    st.markdown("".join(visible), unsafe_allow_html=True)
+
+# Main app logic
+def rerun_fragment(full=False):
+    # Only the running fragment, unless this is a full run (the fragment ran
+    # as part of the page, or under AppTest), where that isn't allowed
+    if not full:
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            pass
+    st.rerun()
+
+def current_search():
+    # Both fragments need the results; they are kept until the query or the
+    # user's chats change, so a run searches at most once
+    query = st.session_state.get("search_input", "")
+    if not query:
+        return query, st.session_state.chats, {}
+    record = st.session_state.user_record
+    key = (query, record, record.version)
+    cached = st.session_state.get("search_results")
+    if cached is None or cached[0] != key:
+        cached = (key, search_chats(query))
+        st.session_state.search_results = cached
+    return (query, *cached[1])
+
+@st.fragment
+def chat_list():
+    # Typing a search or deleting another chat only redraws this list; the
+    # whole page reruns when the chat shown on the right has to change
+    sync_user_data()
+    
+    # Search functionality
+    st.text_input("🔍 Search chats...", placeholder="Search in titles and messages", key="search_input")
+    
+    st.markdown("---")
+    
+    # Filter chats based on search
+    search_query, display_chats, search_highlights = current_search()
+    active_before = st.session_state.active_chat_id
+    if search_query:
+        # Auto-select first matching chat if not already selected
+        if display_chats and (not st.session_state.active_chat_id or st.session_state.active_chat_id not in search_highlights):
+            st.session_state.active_chat_id = display_chats[0]['id']
+    
+    # A new search that moves or re-highlights the open chat needs the transcript redrawn
+    drawn_query, drawn_highlights = st.session_state.get("search_drawn", ("", []))
+    active_highlights = search_highlights.get(st.session_state.active_chat_id, [])
+    st.session_state.search_drawn = (search_query, active_highlights)
+    if search_query != drawn_query and (st.session_state.active_chat_id != active_before or active_highlights != drawn_highlights):
+        st.rerun()
+    
+    if not display_chats and search_query:
+        st.info("No chats found matching your search.")
+    
+    for chat in display_chats:
+        is_active = chat["id"] == st.session_state.active_chat_id
         
-        # Search in messages
-        for i, message in enumerate(chat['messages']):
-            if query_lower in message['content'].lower():
-                matching_messages.append(i)
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            if st.button(
+                f"💬 {chat['title']}", 
+                key=f"chat_{chat['id']}", 
+                use_container_width=True,
+                type="primary" if is_active else "secondary"
+            ):
+                st.session_state.active_chat_id = chat["id"]
+                st.rerun()
         
-        if title_match or matching_messages:
-            filtered_chats.append(chat)
-            search_highlights[chat['id']] = matching_messages
+        with col2:
+            if st.button("🗑️", key=f"delete_{chat['id']}", help="Delete chat"):
+                delete_chat(chat["id"])
+                rerun_fragment(full=is_active)
+
+@st.fragment
+def chat_pane():
+    # Transcript and composer. A send reruns just this part unless the
+    # sidebar has to show a new chat or a new title.
+    record = sync_user_data()
+    
+    active_chat = None
+    if st.session_state.active_chat_id:
+        active_chat = st.session_state.chat_index.get(st.session_state.active_chat_id)
+    
+    if active_chat and active_chat["messages"]:
+        # Highlight this chat's search matches
+        search_query, _, search_highlights = current_search()
+        highlight_indices = search_highlights.get(active_chat['id'], [])
+        started = time.perf_counter()
+        render_transcript(active_chat, search_query if highlight_indices else "", highlight_indices)
+        get_metrics().observe("render", time.perf_counter() - started)
+    
+    # Streamed replies are drawn here, under the transcript, until the rerun
+    stream_area = st.container()
     
-    return filtered_chats, search_highlights
+    with st.form("message_form", clear_on_submit=True):
+        col1, col2 = st.columns([9, 1])
+        
+        with col1:
+            user_message = st.text_input(
+                "Type your message…", 
+                placeholder="Chat with Nexia (Press Enter to send)", 
+                label_visibility="collapsed",
+                max_chars=2000,
+                key="message_input"
+            )
+        
+        with col2:
+            send_button = st.form_submit_button("➤", use_container_width=True)
+        
+        if send_button and user_message.strip():
+            turn = Turn()
+            created = not active_chat
+            if not active_chat:
+                active_chat = create_new_chat()
+            title_before = active_chat["title"]
+            
+            user_msg = {"role": "user", "content": user_message.strip()}
+            with turn.span("append"):
+                record.append_message(active_chat, user_msg)
+            
+            if len(active_chat["messages"]) == 1:
+                # Use actual first message content as title
+                first_msg = user_message.strip()
+                if len(first_msg) > 40:
+                    active_chat["title"] = first_msg[:37] + "..."
+                else:
+                    active_chat["title"] = first_msg
+            
+            on_token = None
+            if get_setting("GROQ_STREAM", True):
+                with stream_area:
+                    st.markdown(message_html(user_msg), unsafe_allow_html=True)
+                    reply_placeholder = st.empty()
+                
+                def on_token(text):
+                    reply_placeholder.markdown(message_html({"role": "assistant", "content": text}), unsafe_allow_html=True)
+            
+            with st.spinner("Nexia is typing..."):
+                ai_response = send_message_to_groq(active_chat["messages"][:-1], user_message.strip(), on_token=on_token, chat=active_chat, turn=turn)
+            
+            ai_msg = {"role": "assistant", "content": ai_response}
+            with turn.span("append"):
+                record.append_message(active_chat, ai_msg)
+            
+            # Contextual title that evolves with conversation; only the new message is scored
+            with turn.span("title"):
+                active_chat["title"] = refresh_chat_title(active_chat)
+            record.touch()
+            
+            # Another session may have deleted this chat while the reply
+            # was on its way; saving it then would bring it back
+            with turn.span("persist"):
+                if record.chat_index.get(active_chat["id"]) is active_chat:
+                    save_user_chat(st.session_state.user_email, active_chat)
+                get_write_queue().save_insights(st.session_state.user_email, record.take_unsaved_insights())
+            get_metrics().record_turn(turn, streamed=on_token is not None, reply_chars=len(ai_response))
+            rerun_fragment(full=created or active_chat["title"] != title_before)
 
-# Main app logic
 def main():
     st.markdown(get_theme_css(st.session_state.dark_mode), unsafe_allow_html=True)
     
+    if st.session_state.authenticated:
+        refresh_session()
+    
     if not st.session_state.authenticated:
         st.markdown('<h1 class="main-header">Nexia</h1>', unsafe_allow_html=True)
         st.markdown('<p style="text-align: center; color: #666; font-size: 1.1rem;">Your Friendly AI Companion</p>', unsafe_allow_html=True)
@@ -649,7 +1015,8 @@ def main():
                         if authenticate_user(email, password):
                             st.session_state.authenticated = True
                             st.session_state.user_email = email
-                            st.session_state.chats = load_user_chats(email)
+                            st.session_state.user_record = None
+                            st.session_state.transcript_cache = {}
                             save_session(email)
                             st.rerun()
                         else:
@@ -668,7 +1035,8 @@ def main():
                         if success:
                             st.session_state.authenticated = True
                             st.session_state.user_email = email
-                            st.session_state.chats = load_user_chats(email)
+                            st.session_state.user_record = None
+                            st.session_state.transcript_cache = {}
                             save_session(email)
                             st.rerun()
                         else:
@@ -677,6 +1045,8 @@ def main():
             st.info("**Demo credentials:**\nEmail: demo@nexia.ai\nPassword: demo123")
     
     else:
+        record = sync_user_data()
+        
         with st.sidebar:
             st.markdown('<h2 class="main-header" style="font-size: 1.5rem;">Nexia</h2>', unsafe_allow_html=True)
             
@@ -684,41 +1054,7 @@ def main():
                 create_new_chat()
                 st.rerun()
             
-            # Search functionality
-            search_query = st.text_input("🔍 Search chats...", placeholder="Search in titles and messages", key="search_input")
-            
-            st.markdown("---")
-            
-            # Filter chats based on search
-            if search_query:
-                display_chats, search_highlights = search_chats(search_query)
-                # Auto-select first matching chat if not already selected
-                if display_chats and (not st.session_state.active_chat_id or st.session_state.active_chat_id not in [c['id'] for c in display_chats]):
-                    st.session_state.active_chat_id = display_chats[0]['id']
-            else:
-                display_chats, search_highlights = st.session_state.chats, {}
-            
-            if not display_chats and search_query:
-                st.info("No chats found matching your search.")
-            
-            for chat in display_chats:
-                is_active = chat["id"] == st.session_state.active_chat_id
-                
-                col1, col2 = st.columns([4, 1])
-                with col1:
-                    if st.button(
-                        f"💬 {chat['title']}", 
-                        key=f"chat_{chat['id']}", 
-                        use_container_width=True,
-                        type="primary" if is_active else "secondary"
-                    ):
-                        st.session_state.active_chat_id = chat["id"]
-                        st.rerun()
-                
-                with col2:
-                    if st.button("🗑️", key=f"delete_{chat['id']}", help="Delete chat"):
-                        delete_chat(chat["id"])
-                        st.rerun()
+            chat_list()
             
             st.markdown("---")
             
@@ -731,115 +1067,93 @@ def main():
                 st.session_state.dark_mode = not st.session_state.dark_mode
                 st.rerun()
             
+            with st.expander("📊 Insights"):
+                summary = record.insights_summary()
+                st.caption(f"{summary['messages']} messages · {summary['turns']} replies · "
+                           f"{summary['avg_response_chars']} chars per reply on average")
+                if summary["moods_by_day"]:
+                    st.table([{"day": day, **counts} for day, counts in summary["moods_by_day"].items()])
+                if summary["topics"]:
+                    st.table([{"topic": topic, "messages": count} for topic, count in summary["topics"].items()])
+                if not summary["messages"]:
+                    st.caption("Nothing yet. Start chatting!")
+            
+            with st.expander("🧠 Memory"):
+                facts = dict(record.memory.facts)
+                if facts:
+                    st.table([{"fact": fact, "value": value} for fact, value in facts.items()])
+                    if st.button("Forget these", use_container_width=True):
+                        # Only the facts shown; any learned meanwhile stay
+                        with record.lock:
+                            for fact in facts:
+                                record.memory.facts.pop(fact, None)
+                        get_write_queue().save_facts(st.session_state.user_email, {}, removed=facts)
+                        st.rerun()
+                else:
+                    st.caption("Nothing remembered about you yet.")
+                st.caption("Nexia also recalls relevant bits of your other chats; deleting a chat removes it from memory.")
+            
+            with st.expander("📦 Export / import"):
+                compress = st.checkbox("Compress (gzip)", key="export_gzip")
+                email = st.session_state.user_email
+                st.download_button(
+                    "⬇️ Export chats",
+                    data=lambda: export_user_chats(email, compress),
+                    file_name="nexia_chats.jsonl.gz" if compress else "nexia_chats.jsonl",
+                    mime="application/gzip" if compress else "application/x-ndjson",
+                    use_container_width=True
+                )
+                uploaded = st.file_uploader("Import chats", type=["jsonl", "gz"], key="import_file")
+                if uploaded is not None and st.button("⬆️ Import", use_container_width=True):
+                    st.session_state.import_result = import_user_chats(uploaded)
+                    st.rerun()
+                if "import_result" in st.session_state:
+                    imported, error = st.session_state.pop("import_result")
+                    if error:
+                        st.error(f"Imported {imported} chats, then stopped: {error}")
+                    else:
+                        st.success(f"Imported {imported} chats.")
+            
+            if is_admin():
+                with st.expander("⚙️ Model health"):
+                    health = get_model_health().snapshot()
+                    if health:
+                        st.table([{"model": model, **stats} for model, stats in health.items()])
+                    else:
+                        st.caption("No requests yet.")
+                with st.expander("⏱️ Turn latency"):
+                    latency = get_metrics().percentiles()
+                    if latency:
+                        st.table([{"stage": stage, **stats} for stage, stats in latency.items()])
+                    else:
+                        st.caption("No turns yet.")
+                with st.expander("🌐 Groq client"):
+                    client = get_groq_client().stats()
+                    pools = client.pop("pools")
+                    st.table([client])
+                    if pools:
+                        st.table(pools)
+                    st.table([get_rate_limiter().stats()])
+                    if get_setting("RESPONSE_CACHE", False):
+                        st.table([get_response_cache().stats()])
+                    else:
+                        st.caption("Response cache is off.")
+                with st.expander("💾 Write queue"):
+                    st.table([get_write_queue().stats()])
+                    st.table([get_user_store().stats()])
+            
             st.markdown(f"**User:** {st.session_state.user_email}")
             if st.button("🚪 Logout"):
                 clear_session()
                 st.session_state.authenticated = False
+                st.session_state.user_record = None
                 st.rerun()
         
         st.markdown('<h3 style="text-align: center;">Chat with Nexia, Your Friendly AI Companion</h3>', unsafe_allow_html=True)
         
-        active_chat = None
-        if st.session_state.active_chat_id:
-            active_chat = next((chat for chat in st.session_state.chats if chat["id"] == st.session_state.active_chat_id), None)
-        
-        if active_chat and active_chat["messages"]:
-            # Check if we're in search mode and have highlights for this chat
-            search_query = st.session_state.get('search_input', '')
-            if search_query:
-                _, search_highlights = search_chats(search_query)
-                highlight_indices = search_highlights.get(active_chat['id'], [])
-            else:
-                highlight_indices = []
-            
-            for i, message in enumerate(active_chat["messages"]):
-                # Highlight matching messages
-                highlight_class = " search-highlight" if i in highlight_indices else ""
-                
-                if message["role"] == "user":
-                    col1, col2 = st.columns([10, 1])
-                    with col1:
-                        content = message["content"]
-                        if search_query and i in highlight_indices:
-                            highlighted_content = content.replace(search_query, f'<mark style="background-color: yellow; color: black;">{search_query}</mark>')
-                            st.markdown(f'<div class="chat-message user-message{highlight_class}">{highlighted_content}</div>', unsafe_allow_html=True)
-                        else:
-                            st.markdown(f'<div class="chat-message user-message{highlight_class}">{content}</div>', unsafe_allow_html=True)
-                    with col2:
-                        with st.expander("📋", expanded=False):
-                            st.code(message["content"], language=None)
-                else:
-                    col1, col2 = st.columns([10, 1])
-                    with col1:
-                        content = message["content"]
-                        if search_query and i in highlight_indices:
-                            highlighted_content = content.replace(search_query, f'<mark style="background-color: yellow; color: black;">{search_query}</mark>')
-                            st.markdown(f'<div class="chat-message assistant-message{highlight_class}">🤖 {highlighted_content}</div>', unsafe_allow_html=True)
-                        else:
-                            st.markdown(f'<div class="chat-message assistant-message{highlight_class}">🤖 {content}</div>', unsafe_allow_html=True)
-                    with col2:
-                        with st.expander("📋", expanded=False):
-                            st.code(message["content"], language=None)
-
-        
-
-
-
-        with st.form("message_form", clear_on_submit=True):
-            col1, col2 = st.columns([9, 1])
-            
-            with col1:
-                user_message = st.text_input(
-                    "Type your message…", 
-                    placeholder="Chat with Nexia (Press Enter to send)", 
-                    label_visibility="collapsed",
-                    max_chars=2000,
-                    key="message_input"
-                )
-            
-            with col2:
-                send_button = st.form_submit_button("➤", use_container_width=True)
-            
-            if send_button and user_message.strip():
-                if not active_chat:
-                    active_chat = create_new_chat()
-                
-                user_msg = {"role": "user", "content": user_message.strip()}
-                active_chat["messages"].append(user_msg)
-                
-                if len(active_chat["messages"]) == 1:
-                    # Use actual first message content as title
-                    first_msg = user_message.strip()
-                    if len(first_msg) > 40:
-                        active_chat["title"] = first_msg[:37] + "..."
-                    else:
-                        active_chat["title"] = first_msg
-                
-                with st.spinner("Nexia is typing..."):
-                    ai_response = send_message_to_groq(active_chat["messages"][:-1], user_message.strip())
-                
-                ai_msg = {"role": "assistant", "content": ai_response}
-                active_chat["messages"].append(ai_msg)
-                
-                # Generate contextual title that evolves with conversation
-                if len(active_chat["messages"]) >= 2:
-                    smart_title = generate_chat_title_from_conversation(active_chat["messages"])
-                    if smart_title and smart_title != "Chat with Nexia" and len(smart_title) > 3:
-                        active_chat["title"] = smart_title
-                
-                # Update title again after more conversation for better accuracy
-                if len(active_chat["messages"]) >= 6:
-                    updated_title = generate_chat_title_from_conversation(active_chat["messages"])
-                    if updated_title and updated_title != active_chat["title"] and len(updated_title) > 3:
-                        active_chat["title"] = updated_title
-                
-                for i, chat in enumerate(st.session_state.chats):
-                    if chat["id"] == active_chat["id"]:
-                        st.session_state.chats[i] = active_chat
-                        break
-                
-                save_user_chats(st.session_state.user_email, st.session_state.chats)
-                st.rerun()
+        chat_pane()
+    
+    write_session_cookie()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,259 @@
+"""Micro-benchmarks for Nexia's hot paths.
+
+Runs headless on synthetic users, chats and English/Tanglish messages,
+without starting Streamlit or touching the real database:
+
+    python bench.py --users 50 --chats 20 --messages 30 --output bench.json
+    python bench.py --baseline bench_baseline.json --threshold 0.25
+    python bench.py --sizes 100,1000,10000
+
+With --sizes the suite runs once per size, each size being the messages
+per user (spread over --chats), and every result is named `<bench>@<size>`.
+
+Results are written as JSON. With --baseline, any benchmark whose median
+is more than --threshold slower than the baseline's is reported and the
+exit status is 1. --save-baseline writes the results as the new baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import storage
+from analysis import (MOOD_KEYWORDS, TANGLISH_WORDS, TITLE_CATEGORIES, detect_mood, detect_tanglish,
+                      extract_user_info, generate_chat_title_from_conversation)
+from insights import UserInsights
+from memory import LongTermMemory
+from message_log import MessageLog
+from prompts import get_enhanced_system_prompt
+from search_index import SearchIndex
+
+ENGLISH_WORDS = (
+    "today was long and i could not stop thinking about what happened at lunch "
+    "maybe we should plan something for the weekend with everyone from home "
+    "the weather changed again so i stayed inside and read for a while"
+).split()
+
+OPENERS = ["my name is {name}", "i am {name}", "call me {name}", "hey nexia", "so listen", "okay"]
+NAMES = ["priya", "arun", "divya", "karthik", "meena", "vijay", "sam", "lakshmi"]
+
+
+def _topic_words():
+    words = []
+    for category, data in TITLE_CATEGORIES.items():
+        if category == 'emotions':
+            for emotion in data.values():
+                words.extend(emotion['keywords'])
+        else:
+            words.extend(data['keywords'])
+    return words
+
+
+TOPIC_WORDS = _topic_words()
+MOOD_WORDS = [word for keywords in MOOD_KEYWORDS.values() for word in keywords]
+
+
+def make_message(rng, tanglish_share=0.4, length=18):
+    words = [rng.choice(OPENERS).format(name=rng.choice(NAMES))]
+    tanglish = rng.random() < tanglish_share
+    for _ in range(length):
+        roll = rng.random()
+        if tanglish and roll < 0.3:
+            words.append(rng.choice(TANGLISH_WORDS))
+        elif roll < 0.4:
+            words.append(rng.choice(TOPIC_WORDS))
+        elif roll < 0.45:
+            words.append(rng.choice(MOOD_WORDS))
+        else:
+            words.append(rng.choice(ENGLISH_WORDS))
+    return " ".join(words)
+
+
+def make_users(n_users, n_chats, n_messages, seed=0):
+    # {email: {"password", "created_at", "chats"}} in the load_users_db shape
+    rng = random.Random(seed)
+    users = {}
+    chat_id = 0
+    for u in range(n_users):
+        chats = []
+        for _ in range(n_chats):
+            chat_id += 1
+            messages = MessageLog()
+            for m in range(n_messages):
+                role = "user" if m % 2 == 0 else "assistant"
+                messages.add(role, make_message(rng, length=rng.randint(6, 40)))
+            chats.append({"id": chat_id, "title": "New Chat", "messages": messages,
+                          "created_at": datetime(2025, 1, 1).isoformat()})
+        users[f"user{u}@bench.nexia"] = {"password": "secret1", "created_at": datetime(2025, 1, 1).isoformat(),
+                                         "chats": chats}
+    return users
+
+
+def measure(func, inputs, repeat):
+    # Median/min seconds per call over `repeat` rounds through `inputs`
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for args in inputs:
+            func(*args)
+        rounds.append((time.perf_counter() - started) / len(inputs))
+    median = statistics.median(rounds)
+    return {
+        "calls": len(inputs) * repeat,
+        "median_ms": round(median * 1000, 4),
+        "min_ms": round(min(rounds) * 1000, 4),
+        "ops_per_sec": round(1 / median, 1) if median else None,
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    users = make_users(args.users, args.chats, args.messages, args.seed)
+    all_chats = [chat for user in users.values() for chat in user["chats"]]
+    texts = [message["content"] for chat in all_chats for message in chat["messages"]][:args.samples]
+    one_user_chats = next(iter(users.values()))["chats"]
+    index = SearchIndex.from_chats(one_user_chats)
+    queries = [rng.choice(text.split()) for text in rng.sample(texts, min(len(texts), 50))]
+
+    results = {}
+    single = [(text,) for text in texts]
+    results["detect_mood"] = measure(detect_mood, single, args.repeat)
+    results["detect_tanglish"] = measure(detect_tanglish, single, args.repeat)
+    results["extract_user_info"] = measure(extract_user_info, single, args.repeat)
+    results["get_enhanced_system_prompt"] = measure(
+        get_enhanced_system_prompt,
+        [(detect_tanglish(text), "user@bench.nexia", detect_mood(text)) for text in texts],
+        args.repeat
+    )
+    results["generate_chat_title_from_conversation"] = measure(
+        generate_chat_title_from_conversation, [(chat["messages"],) for chat in all_chats], args.repeat
+    )
+    results["insights_add"] = measure(
+        UserInsights().add, [({"role": "user", "content": text},) for text in texts], args.repeat
+    )
+    memory = LongTermMemory.from_chats(one_user_chats)
+    results["memory_recall"] = measure(
+        lambda text: memory.recall(text, exclude_chat=one_user_chats[0]["id"]), single, args.repeat
+    )
+    results["search_chats"] = measure(
+        lambda query: index.search(query, one_user_chats), [(query,) for query in queries], args.repeat
+    )
+
+    # Whole-database round trip on scratch files; every save starts from an empty database
+    with tempfile.TemporaryDirectory() as tmp:
+        saved_paths = storage.DB_FILE, storage.LEGACY_DB_FILE
+        storage.LEGACY_DB_FILE = os.path.join(tmp, "no_legacy.pkl")
+        fresh_dbs = iter(range(args.db_repeat + 1))
+
+        def save_fresh(users):
+            storage.DB_FILE = os.path.join(tmp, f"bench{next(fresh_dbs)}.db")
+            storage.save_users_db(users)
+
+        try:
+            results["save_users_db"] = measure(save_fresh, [(users,)], args.db_repeat)
+            results["load_users_db"] = measure(storage.load_users_db, [()], args.db_repeat)
+        finally:
+            storage.DB_FILE, storage.LEGACY_DB_FILE = saved_paths
+
+    return {
+        "meta": {
+            "users": args.users,
+            "chats_per_user": args.chats,
+            "messages_per_chat": args.messages,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def run_sizes(args):
+    # One run per size, merged into a single report keyed `<bench>@<size>`
+    report = None
+    for size in args.sizes:
+        sized = argparse.Namespace(**{**vars(args), "messages": max(1, size // args.chats)})
+        sized_report = run(sized)
+        if report is None:
+            report = {"meta": {**sized_report["meta"], "sizes": args.sizes}, "results": {}}
+            del report["meta"]["messages_per_chat"]
+        for name, stats in sized_report["results"].items():
+            report["results"][f"{name}@{size}"] = stats
+    return report
+
+
+def parse_sizes(text):
+    try:
+        sizes = [int(size) for size in text.split(",") if size.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated integers, got {text!r}")
+    if not sizes or min(sizes) < 1:
+        raise argparse.ArgumentTypeError("sizes must be positive")
+    return sizes
+
+
+def compare(report, baseline, threshold):
+    # [(name, baseline ms, current ms, ratio)] for benchmarks that got slower than allowed
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        current = report["results"].get(name)
+        if current is None or not base.get("median_ms"):
+            continue
+        ratio = current["median_ms"] / base["median_ms"]
+        if ratio > 1 + threshold:
+            regressions.append((name, base["median_ms"], current["median_ms"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--chats", type=int, default=10, help="chats per user")
+    parser.add_argument("--messages", type=int, default=20, help="messages per chat")
+    parser.add_argument("--samples", type=int, default=2000, help="messages fed to the per-message benchmarks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db-repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sizes", type=parse_sizes,
+                        help="comma-separated messages per user, e.g. 100,1000,10000; one run per size")
+    parser.add_argument("--output", help="write the JSON results here (default: stdout)")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline")
+    args = parser.parse_args(argv)
+
+    report = run_sizes(args) if args.sizes else run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for name, stats in report["results"].items():
+        print(f"{name:46s} {stats['median_ms']:>10.4f} ms  {stats['ops_per_sec'] or 0:>12.1f}/s", file=sys.stderr)
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text + "\n")
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    for name, before, after, ratio in regressions:
+        print(f"REGRESSION {name}: {before:.4f} ms -> {after:.4f} ms ({ratio:.2f}x)", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
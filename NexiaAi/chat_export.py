@@ -0,0 +1,120 @@
+"""Streaming JSON-lines export and import of a user's chats.
+
+An export is a header line, then for each chat (oldest first) a chat
+record followed by one record per message:
+
+    {"type": "header", "format": "nexia-chats", "version": 1, ...}
+    {"type": "chat", "id": 3, "title": "...", "created_at": "...", "meta": {}}
+    {"type": "message", "chat_id": 3, "idx": 0, "role": "user", "content": "..."}
+
+Both directions hold one chat at a time, so memory doesn't grow with the
+size of the history. Files may be gzip-compressed.
+"""
+import gzip
+import io
+import json
+import tempfile
+from datetime import datetime
+
+import storage
+from message_log import ROLES, MessageLog
+
+FORMAT = "nexia-chats"
+VERSION = 1
+
+# Exports bigger than this spill from memory to a temporary file
+SPOOL_BYTES = 8 * 1024 * 1024
+
+# Imported chats written per transaction
+IMPORT_BATCH = 100
+
+
+def export_lines(email):
+    yield json.dumps({"type": "header", "format": FORMAT, "version": VERSION, "email": email,
+                      "exported_at": datetime.now().isoformat(timespec="seconds")})
+    for chat in storage.iter_user_chats(email):
+        meta = {k: v for k, v in chat.items() if k not in storage.CHAT_COLUMNS}
+        yield json.dumps({"type": "chat", "id": chat["id"], "title": chat["title"],
+                          "created_at": chat["created_at"], "meta": meta}, ensure_ascii=False)
+        for idx, message in enumerate(chat["messages"]):
+            yield json.dumps({"type": "message", "chat_id": chat["id"], "idx": idx,
+                              "role": message["role"], "content": message["content"]}, ensure_ascii=False)
+
+
+def write_export(email, fileobj, compress=False):
+    out = gzip.GzipFile(fileobj=fileobj, mode="wb") if compress else fileobj
+    try:
+        for line in export_lines(email):
+            out.write(line.encode("utf-8") + b"\n")
+    finally:
+        if compress:
+            out.close()
+
+
+def export_file(email, compress=False):
+    # A rewound file holding the export, for st.download_button
+    f = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    write_export(email, f, compress)
+    f.seek(0)
+    return f
+
+
+def _text_lines(fileobj):
+    # Accepts plain or gzip-compressed bytes
+    magic = fileobj.read(2)
+    fileobj.seek(0)
+    raw = gzip.GzipFile(fileobj=fileobj, mode="rb") if magic == b"\x1f\x8b" else fileobj
+    return io.TextIOWrapper(raw, encoding="utf-8")
+
+
+def read_chats(fileobj, new_id):
+    # Yields chats one at a time, each with a fresh id from new_id() so an
+    # import never overwrites an existing chat. Raises ValueError, naming
+    # the line, on anything that isn't a well-formed export.
+    chat = None
+    old_id = None
+    for line_no, line in enumerate(_text_lines(fileobj), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind = record["type"]
+            if kind == "header":
+                if record.get("format") != FORMAT or record.get("version", 0) > VERSION:
+                    raise ValueError("not a Nexia chat export this version can read")
+            elif kind == "chat":
+                if chat is not None:
+                    yield chat
+                old_id = record["id"]
+                title = record["title"]
+                created_at = record.get("created_at") or datetime.now().isoformat()
+                if not isinstance(title, str) or not isinstance(created_at, str):
+                    raise ValueError("chat title and created_at must be strings")
+                # `meta` only holds state derived from the messages (title
+                # scores, rolling summary); it is rebuilt rather than trusted
+                chat = {"id": new_id(), "title": title, "messages": MessageLog(), "created_at": created_at}
+            elif kind == "message":
+                if chat is None or record["chat_id"] != old_id:
+                    raise ValueError("message outside its chat")
+                if record["role"] not in ROLES:
+                    raise ValueError(f"unknown role {record['role']!r}")
+                chat["messages"].add(record["role"], str(record["content"]))
+            else:
+                raise ValueError(f"unknown record type {kind!r}")
+        except (KeyError, TypeError, AttributeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Line {line_no}: malformed record ({e})") from None
+        except ValueError as e:
+            raise ValueError(f"Line {line_no}: {e}") from None
+    if chat is not None:
+        yield chat
+
+
+def batched(chats, size):
+    batch = []
+    for chat in chats:
+        batch.append(chat)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,85 @@
+"""Token-budgeted conversation context with a rolling summary.
+
+Only the newest turns that fit the model's budget are sent verbatim.
+Older turns are folded into a short extractive summary kept on the chat
+record, and the summary only ever grows by the turns that just left the
+window, so it is never rebuilt from the whole history.
+"""
+
+# History budget in estimated tokens, excluding the system prompt and reply
+MODEL_CONTEXT_BUDGETS = {
+    "llama-3.1-8b-instant": 4000,
+    "llama-3.2-3b-preview": 4000,
+    "gemma2-9b-it": 2500,
+}
+DEFAULT_CONTEXT_BUDGET = 2500
+
+# Share of the budget the summary may take before its oldest lines roll off
+SUMMARY_SHARE = 0.25
+
+MESSAGE_OVERHEAD_TOKENS = 4
+USER_GIST_CHARS = 160
+ASSISTANT_GIST_CHARS = 80
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English and Tanglish text
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def _gist(message):
+    text = " ".join(message["content"].split())
+    if message["role"] == "user":
+        speaker, limit = "User", USER_GIST_CHARS
+    else:
+        speaker, limit = "Nexia", ASSISTANT_GIST_CHARS
+    if len(text) > limit:
+        text = text[:limit - 3].rstrip() + "..."
+    return f"- {speaker}: {text}"
+
+
+def _fold(summary, messages, start, end, max_tokens):
+    lines = summary["text"].split("\n") if summary["text"] else []
+    lines.extend(_gist(msg) for msg in messages[start:end])
+    # Drop the oldest lines once the summary outgrows its share of the budget
+    total = sum(estimate_tokens(line) for line in lines)
+    while lines and total > max_tokens:
+        total -= estimate_tokens(lines.pop(0))
+    return {"text": "\n".join(lines), "upto": end}
+
+
+def _window_start(messages, floor, budget):
+    # Walk back from the newest message until the budget runs out
+    start = len(messages)
+    used = 0
+    while start > floor:
+        cost = estimate_tokens(messages[start - 1]["content"])
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+def fit_context(messages, budget, summary=None):
+    # Returns (messages to send, updated summary). `summary` is the
+    # {"text", "upto"} dict from the chat record; "upto" counts the
+    # messages already folded into it.
+    if not summary or summary["upto"] > len(messages):
+        summary = {"text": "", "upto": 0}
+    summary_budget = int(budget * SUMMARY_SHARE)
+
+    start = _window_start(messages, summary["upto"], budget)
+    if start > summary["upto"] or summary["text"]:
+        # Something is (or will be) summarised, so leave room for it
+        start = _window_start(messages, summary["upto"], budget - summary_budget)
+    if start > summary["upto"]:
+        summary = _fold(summary, messages, summary["upto"], start, summary_budget)
+
+    window = list(messages[start:])
+    if summary["text"]:
+        window.insert(0, {
+            "role": "system",
+            "content": "Summary of earlier messages in this conversation:\n" + summary["text"]
+        })
+    return window, summary
@@ -0,0 +1,209 @@
+"""Pooled HTTP client for the Groq chat completions API."""
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+
+class GroqClient:
+    # One instance is shared by every session of the server process, so
+    # connections to api.groq.com stay open and get reused across reruns.
+
+    def __init__(self, pool_size=10, connect_timeout=5.0, read_timeout=30.0):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self._requests += 1
+        try:
+            return self.session.post(url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+
+    def stats(self):
+        pools = []
+        # Snapshot; urllib3 may add or drop pools while we look
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": idle,
+                "maxsize": pool.pool.maxsize if pool.pool else 0,
+            })
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "connect_timeout": self.timeout[0],
+                "read_timeout": self.timeout[1],
+                "requests": self._requests,
+                "errors": self._errors,
+                "pools": pools,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+def iter_stream_tokens(response, usage=None):
+    # Parses the OpenAI-compatible SSE stream and yields content deltas.
+    # Reads to the end instead of stopping at [DONE] so the connection
+    # goes back to the pool rather than being closed. Token counts from
+    # the final chunk go into `usage` if a dict is passed.
+    response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            continue
+        chunk = json.loads(data)
+        if usage is not None:
+            # Groq reports it under x_groq, OpenAI-style servers at the top level
+            found = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+            if found:
+                usage.update(found)
+        choices = chunk.get("choices")
+        if not choices:
+            continue
+        delta = choices[0].get("delta") or {}
+        if delta.get("content"):
+            yield delta["content"]
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def iter_model_responses(client, url, models, build_payload, stream=False,
+                         hedge_delay=0, deadline=None, health=None, acquire=None, **kwargs):
+    # Yields (model, response) for each model tried, in the order they
+    # answer. The caller asks for the next one only when the previous
+    # failed, and closing the generator abandons whatever is still in
+    # flight. build_payload(model) runs on the caller's thread.
+    #
+    # Without hedge_delay the models are tried one after another. With it,
+    # the next model also starts whenever the current ones have been
+    # quiet for hedge_delay seconds, and the first answer wins. Models
+    # whose breaker in `health` is open are skipped, and every answer or
+    # connection error is reported back to it. acquire(model, payload) is
+    # asked before every request goes out, so a shared rate limit sees
+    # fallbacks and hedges too; once it says no, nothing more is sent.
+    end = time.monotonic() + deadline if deadline else None
+
+    def remaining_timeout():
+        timeout = kwargs.get("timeout", client.timeout)
+        if end is None:
+            return timeout
+        left = end - time.monotonic()
+        if left <= 0:
+            raise requests.exceptions.Timeout("Groq deadline exceeded")
+        connect, read = timeout
+        return (min(connect, left), min(read, left))
+
+    def allowed(model):
+        return health is None or health.allow(model)
+
+    def may_send(model, payload):
+        return acquire is None or acquire(model, payload)
+
+    def report(model, response=None):
+        if health is None:
+            return
+        if response is None:
+            health.record_failure(model)
+        else:
+            health.record_response(model, response)
+
+    if not hedge_delay:
+        for model in models:
+            if not allowed(model):
+                continue
+            payload = build_payload(model)
+            if not may_send(model, payload):
+                return
+            options = dict(kwargs, timeout=remaining_timeout())
+            try:
+                response = client.post(url, json=payload, stream=stream, **options)
+            except requests.exceptions.RequestException:
+                report(model)
+                raise
+            report(model, response)
+            yield model, response
+        return
+
+    queue = list(models)
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=len(models), thread_name_prefix="groq-hedge")
+
+    def launch():
+        # Starts the next model whose breaker allows it; False if none is left
+        while queue:
+            model = queue.pop(0)
+            if allowed(model):
+                payload = build_payload(model)
+                if not may_send(model, payload):
+                    queue.clear()
+                    return False
+                options = dict(kwargs, timeout=remaining_timeout())
+                future = executor.submit(client.post, url, json=payload, stream=stream, **options)
+                pending[future] = model
+                return True
+        return False
+
+    try:
+        launch()
+        next_hedge = time.monotonic() + hedge_delay
+        while pending:
+            wake = [t for t in (next_hedge if queue else None, end) if t is not None]
+            timeout = max(0.0, min(wake) - time.monotonic()) if wake else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if end is not None and time.monotonic() >= end and not done:
+                raise requests.exceptions.Timeout("Groq deadline exceeded")
+            if not done:
+                if queue and time.monotonic() >= next_hedge:
+                    launch()
+                    next_hedge = time.monotonic() + hedge_delay
+                continue
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException:
+                    report(model)
+                    if not pending and not launch():
+                        raise
+                    next_hedge = time.monotonic() + hedge_delay
+                    continue
+                report(model, response)
+                yield model, response
+                # The caller came back for more, so this one failed; move on
+                # straight away unless another model is already running
+                if not pending and launch():
+                    next_hedge = time.monotonic() + hedge_delay
+    finally:
+        # Losers are closed as they arrive; requests not yet started are dropped
+        for future in pending:
+            future.add_done_callback(_close_response)
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,194 @@
+"""Local stand-in for Groq's OpenAI-compatible chat completions API.
+
+For load tests and offline development; it answers every model with a
+canned reply and never calls out:
+
+    python groq_stub.py --port 8787 --latency 0.3 --rate-limit-rate 0.05
+
+then point the app at it in secrets:
+
+    GROQ_API_URL = "http://127.0.0.1:8787/openai/v1/chat/completions"
+
+Latency, per-token streaming delay and the share of requests answered
+with 429 (with Retry-After) or 500 are configurable. GET /stats returns
+request counts as JSON.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY_WORDS = (
+    "I hear you and I'm glad you told me. Let's take it one step at a time, "
+    "what feels like the hardest part right now?"
+).split()
+
+
+class StubConfig:
+
+    def __init__(self, latency=0.2, jitter=0.1, token_delay=0.01, rate_limit_rate=0.0, retry_after=2,
+                 error_rate=0.0, reply_words=24, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.reply_words = reply_words
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "streamed": 0, "ok": 0, "rate_limited": 0, "errors": 0}
+
+    def outcome(self):
+        with self.lock:
+            self.counts["requests"] += 1
+            roll = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if roll < self.rate_limit_rate:
+            kind = "rate_limited"
+        elif roll < self.rate_limit_rate + self.error_rate:
+            kind = "errors"
+        else:
+            kind = "ok"
+        return kind, delay
+
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def _reply(model, messages, words):
+    text = " ".join(REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(words))
+    return f"[{model}] {text}", sum(len(m.get("content", "")) for m in messages) // 4
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.config.stats())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            model = body["model"]
+            messages = body.get("messages", [])
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {"error": {"message": "bad request", "type": "invalid_request_error"}})
+            return
+        config = self.config
+        kind, delay = config.outcome()
+        time.sleep(delay)
+        config.count(kind)
+        if kind == "rate_limited":
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens"}},
+                            [("Retry-After", str(config.retry_after))])
+            return
+        if kind == "errors":
+            self._send_json(500, {"error": {"message": "Internal server error", "type": "internal_error"}})
+            return
+
+        reply, prompt_tokens = _reply(model, messages, config.reply_words)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": config.reply_words,
+                 "total_tokens": prompt_tokens + config.reply_words}
+        if not body.get("stream"):
+            self._send_json(200, {
+                "id": "stub", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        config.count("streamed")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word + (" " if i < len(words) - 1 else "")}
+            self._chunk(f"data: {json.dumps({'choices': [{'index': 0, 'delta': delta}]})}\n\n".encode())
+            if config.token_delay:
+                time.sleep(config.token_delay)
+        # Groq reports usage on the last chunk under x_groq
+        final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+        self._chunk(f"data: {json.dumps(final)}\n\n".encode())
+        self._chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def make_server(host="127.0.0.1", port=0, config=None):
+    # port 0 picks a free port; the URL to use is api_url(server)
+    handler = type("Handler", (StubHandler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def api_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/openai/v1/chat/completions"
+
+
+def start_in_thread(config=None):
+    server = make_server(config=config)
+    threading.Thread(target=server.serve_forever, name="groq-stub", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first byte")
+    parser.add_argument("--jitter", type=float, default=0.1, help="+/- seconds added to --latency")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed words")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument("--retry-after", type=int, default=2, help="Retry-After seconds on 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 500")
+    parser.add_argument("--reply-words", type=int, default=24)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(args.latency, args.jitter, args.token_delay, args.rate_limit_rate, args.retry_after,
+                        args.error_rate, args.reply_words, args.seed)
+    server = make_server(args.host, args.port, config)
+    print(f"Groq stub listening on {api_url(server)}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Per-user rollups of mood, topics and message counts.
+
+Counters are updated as each message is appended, so the insights view
+never rescans a user's history. They live in typed arrays (4 or 8 bytes
+per counter) and serialize to a small blob for the `insights` table.
+Messages carry no timestamp, so a message counts towards the day it was
+appended; the one-time backfill from older chats uses the chat's
+creation day instead. Deleting chats doesn't take them back out: the
+rollups describe activity, not what is currently stored. Counts from
+several processes are combined with `merge`, which adds them up.
+"""
+import json
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime
+
+from analysis import CATEGORY_WEIGHTS, MATCHER, MOOD_KEYWORDS, mood_from_hits
+
+MOODS = tuple(MOOD_KEYWORDS) + ("neutral",)
+TOPICS = tuple(name for name in CATEGORY_WEIGHTS if not name.startswith("emotion_"))
+
+# Slots in UserInsights.totals
+USER_MESSAGES, ASSISTANT_MESSAGES, RESPONSE_CHARS = range(3)
+
+_FORMAT = 1
+
+
+def _day(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            value = None
+    return (value or date.today()).toordinal()
+
+
+class UserInsights:
+
+    def __init__(self):
+        # Sorted day ordinals; mood_counts holds len(MOODS) counters per day
+        self.days = array("I")
+        self.mood_counts = array("I")
+        self.topic_counts = array("I", bytes(4 * len(TOPICS)))
+        self.totals = array("Q", bytes(8 * 3))
+
+    def _day_row(self, day):
+        i = bisect_left(self.days, day)
+        if i == len(self.days) or self.days[i] != day:
+            self.days.insert(i, day)
+            start = i * len(MOODS)
+            self.mood_counts[start:start] = array("I", bytes(4 * len(MOODS)))
+        return i * len(MOODS)
+
+    def add(self, message, when=None):
+        if message["role"] == "user":
+            found = MATCHER.match(message["content"])
+            self.mood_counts[self._day_row(_day(when)) + MOODS.index(mood_from_hits(found))] += 1
+            for i, topic in enumerate(TOPICS):
+                if found.get(topic):
+                    self.topic_counts[i] += 1
+            self.totals[USER_MESSAGES] += 1
+        elif message["role"] == "assistant":
+            self.totals[ASSISTANT_MESSAGES] += 1
+            self.totals[RESPONSE_CHARS] += len(message["content"])
+
+    def merge(self, other):
+        # Adds `other`'s counters to these; returns self
+        for d, day in enumerate(other.days):
+            row = self._day_row(day)
+            for m in range(len(MOODS)):
+                self.mood_counts[row + m] += other.mood_counts[d * len(MOODS) + m]
+        for i, count in enumerate(other.topic_counts):
+            self.topic_counts[i] += count
+        for i, count in enumerate(other.totals):
+            self.totals[i] += count
+        return self
+
+    @classmethod
+    def from_chats(cls, chats):
+        # Backfill for users whose history predates the rollups
+        insights = cls()
+        for chat in chats:
+            when = chat.get("created_at")
+            for message in chat["messages"]:
+                insights.add(message, when)
+        return insights
+
+    def summary(self, days=7):
+        user, assistant, chars = self.totals
+        recent = {}
+        for i in range(max(0, len(self.days) - days), len(self.days)):
+            counts = self.mood_counts[i * len(MOODS):(i + 1) * len(MOODS)]
+            recent[date.fromordinal(self.days[i]).isoformat()] = dict(zip(MOODS, counts))
+        return {
+            "messages": user + assistant,
+            "turns": assistant,
+            "avg_response_chars": round(chars / assistant) if assistant else 0,
+            "moods_by_day": recent,
+            "topics": {t: n for t, n in sorted(zip(TOPICS, self.topic_counts), key=lambda x: -x[1]) if n},
+        }
+
+    def to_bytes(self):
+        # JSON header naming the moods and topics, then the raw arrays
+        header = json.dumps({"v": _FORMAT, "moods": MOODS, "topics": TOPICS, "days": len(self.days)})
+        return b"".join([header.encode(), b"\n", self.days.tobytes(), self.mood_counts.tobytes(),
+                         self.topic_counts.tobytes(), self.totals.tobytes()])
+
+    @classmethod
+    def from_bytes(cls, blob):
+        head, _, body = bytes(blob).partition(b"\n")
+        header = json.loads(head)
+        moods, topics, n_days = header["moods"], header["topics"], header["days"]
+        parts = []
+        for typecode, count in (("I", n_days), ("I", n_days * len(moods)), ("I", len(topics)), ("Q", 3)):
+            part = array(typecode)
+            size = part.itemsize * count
+            part.frombytes(body[:size])
+            body = body[size:]
+            parts.append(part)
+        days, mood_counts, topic_counts, totals = parts
+
+        insights = cls()
+        insights.totals = totals
+        if list(moods) == list(MOODS) and list(topics) == list(TOPICS):
+            insights.days, insights.mood_counts, insights.topic_counts = days, mood_counts, topic_counts
+            return insights
+        # Stored before a mood or topic was added or renamed: map by name
+        for i, topic in enumerate(topics):
+            if topic in TOPICS:
+                insights.topic_counts[TOPICS.index(topic)] = topic_counts[i]
+        for d, day in enumerate(days):
+            row = insights._day_row(day)
+            for m, mood in enumerate(moods):
+                if mood in MOODS:
+                    insights.mood_counts[row + MOODS.index(mood)] += mood_counts[d * len(moods) + m]
+        return insights
@@ -0,0 +1,275 @@
+"""Load test that drives the real app through Streamlit's AppTest.
+
+Simulated users sign up, send messages, start new chats, switch between
+chats and search. Replies come from groq_stub.py; that is a local server
+unless --api-url points at one. Everything runs against a scratch
+database:
+
+    python load_test.py --users 10 --messages 6 --latency 0.2
+    python load_test.py --users 20 --processes 4 --rate-limit-rate 0.1 --error-rate 0.02 --output load.json
+
+AppTest swaps process-wide Streamlit state on every run, so a process
+can only run one app run at a time. Each process therefore takes its
+users' actions in turn, sharing one set of caches and background
+workers the way a single Streamlit server would. --processes adds real
+concurrency, as several servers sharing the database would.
+
+The report covers throughput, p50/p95/p99 for each user action and for
+each stage of a chat turn (from the app's metrics log), the stub's
+request counts and each process's peak memory.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import groq_stub
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+WORDS = ("exam", "work", "family", "weekend", "movie", "tired", "happy", "travel", "food", "rain")
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+
+    def at(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+    return {"count": len(values), "p50_ms": at(0.5), "p95_ms": at(0.95), "p99_ms": at(0.99),
+            "max_ms": round(values[-1] * 1000, 1)}
+
+
+class LoadUser:
+
+    def __init__(self, n, args, secrets, timings, errors):
+        self.email = f"load{n}@nexia.test"
+        self.args = args
+        self.secrets = secrets
+        self.timings = timings
+        self.errors = errors
+        self.rng = random.Random(args.seed + n)
+
+    def _timed(self, action, func):
+        started = time.perf_counter()
+        try:
+            func()
+            self.at.run()
+        except Exception as e:
+            self.errors[action].append(repr(e))
+            return False
+        self.timings[action].append(time.perf_counter() - started)
+        if self.at.exception:
+            self.errors[action].append(str(self.at.exception[0].value))
+            return False
+        return True
+
+    def _button(self, label=None, key=None):
+        for button in self.at.button:
+            if (label is None or button.label == label) and (key is None or button.key == key):
+                return button
+        raise LookupError(f"no button {label or key!r}")
+
+    def sign_up(self):
+        def fill():
+            self.at.text_input(key="signup_email").input(self.email)
+            self.at.text_input(key="signup_password").input("loadtest")
+            self._button("Sign Up").click()
+        return self._timed("sign_in", fill)
+
+    def send(self):
+        text = " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(3, 12)))
+        return self._timed("send", lambda: (self.at.text_input(key="message_input").input(text),
+                                            self._button("➤").click()))
+
+    def new_chat(self):
+        return self._timed("new_chat", lambda: self._button("➕ New Chat").click())
+
+    def switch_chat(self):
+        chats = [b for b in self.at.button if b.key and b.key.startswith("chat_")]
+        if len(chats) < 2:
+            return True
+        return self._timed("switch_chat", lambda: self.rng.choice(chats).click())
+
+    def search(self):
+        def query():
+            self.at.text_input(key="search_input").input(self.rng.choice(WORDS))
+        ok = self._timed("search", query)
+        self.at.text_input(key="search_input").input("")
+        self.at.run()
+        return ok
+
+    def actions(self):
+        # One app run per step, so a process can interleave its users
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP, default_timeout=self.args.timeout)
+        for name, value in self.secrets.items():
+            self.at.secrets[name] = value
+        if not self._timed("page_load", lambda: None):
+            return
+        yield
+        if not self.sign_up():
+            return
+        yield
+        for i in range(self.args.messages):
+            if i % self.args.messages_per_chat == 0:
+                self.new_chat()
+                yield
+            self.send()
+            yield
+            if self.rng.random() < self.args.switch_rate:
+                self.switch_chat()
+                yield
+            if self.rng.random() < self.args.search_rate:
+                self.search()
+                yield
+
+
+def run_users(numbers, args, secrets):
+    # Runs in a worker process: takes each user's next action in turn
+    timings = defaultdict(list)
+    errors = defaultdict(list)
+    active = [LoadUser(n, args, secrets, timings, errors).actions() for n in numbers]
+    while active:
+        for steps in list(active):
+            if next(steps, StopIteration) is StopIteration:
+                active.remove(steps)
+    # ru_maxrss is kilobytes on Linux
+    return dict(timings), dict(errors), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="nexia-load-")
+    os.chdir(workdir)
+    # Read by storage on import, so it has to be set before the first run
+    os.environ["NEXIA_DB_PATH"] = os.path.join(workdir, "load.db")
+
+    stub = None
+    api_url = args.api_url
+    if not api_url:
+        stub = groq_stub.start_in_thread(groq_stub.StubConfig(
+            latency=args.latency, jitter=args.jitter, token_delay=args.token_delay,
+            rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+            error_rate=args.error_rate, seed=args.seed
+        ))
+        api_url = groq_stub.api_url(stub)
+
+    secrets = {
+        "GROQ_API_KEY": "load-test",
+        "GROQ_API_URL": api_url,
+        "GROQ_STREAM": not args.no_stream,
+    }
+    if not args.keep_limits:
+        # The app's own limits would measure the limiter rather than the app
+        secrets.update({"GROQ_RPM": 1_000_000, "GROQ_TPM": 1_000_000_000, "RATE_LIMIT_USER_RPM": 1_000_000})
+
+    timings = defaultdict(list)
+    errors = defaultdict(list)
+    peak_rss = []
+    processes = max(1, min(args.processes, args.users))
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [
+            pool.submit(run_users, range(p, args.users, processes), args,
+                        {**secrets, "METRICS_LOG_FILE": os.path.join(workdir, f"turns{p}.jsonl")})
+            for p in range(processes)
+        ]
+        for future in futures:
+            part_timings, part_errors, rss = future.result()
+            for action, values in part_timings.items():
+                timings[action] += values
+            for action, messages in part_errors.items():
+                errors[action] += messages
+            peak_rss.append(round(rss, 1))
+    elapsed = time.perf_counter() - started
+
+    stages = defaultdict(list)
+    statuses = defaultdict(int)
+    for p in range(processes):
+        metrics_log = os.path.join(workdir, f"turns{p}.jsonl")
+        if not os.path.exists(metrics_log):
+            continue
+        with open(metrics_log, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                statuses[str(record.get("status"))] += 1
+                for stage, ms in record["spans_ms"].items():
+                    stages[stage].append(ms / 1000)
+
+    actions = sum(len(values) for values in timings.values())
+    return {
+        "meta": {
+            "users": args.users,
+            "messages_per_user": args.messages,
+            "processes": processes,
+            "api_url": api_url,
+            "stub": None if args.api_url else {
+                "latency": args.latency, "token_delay": args.token_delay,
+                "rate_limit_rate": args.rate_limit_rate, "error_rate": args.error_rate,
+            },
+            "elapsed_s": round(elapsed, 2),
+        },
+        "throughput": {
+            "actions_per_sec": round(actions / elapsed, 2),
+            "turns_per_sec": round(len(timings["send"]) / elapsed, 2),
+        },
+        "actions": {action: percentiles(values) for action, values in sorted(timings.items())},
+        "turn_stages": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        "turn_statuses": dict(statuses),
+        "errors": {action: {"count": len(messages), "first": messages[0]} for action, messages in errors.items()},
+        "stub_requests": stub.RequestHandlerClass.config.stats() if stub else None,
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5, help="concurrent simulated users")
+    parser.add_argument("--messages", type=int, default=5, help="messages each user sends")
+    parser.add_argument("--messages-per-chat", type=int, default=3, help="start a new chat every N messages")
+    parser.add_argument("--switch-rate", type=float, default=0.5, help="chance of switching chats after a send")
+    parser.add_argument("--search-rate", type=float, default=0.3, help="chance of searching after a send")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes sharing the users")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds allowed for one app run")
+    parser.add_argument("--no-stream", action="store_true", help="ask for whole replies instead of streams")
+    parser.add_argument("--keep-limits", action="store_true", help="keep the app's default rate limits")
+    parser.add_argument("--api-url", help="use this API instead of starting the stub")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub: seconds before the first byte")
+    parser.add_argument("--jitter", type=float, default=0.1, help="stub: +/- seconds on --latency")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="stub: seconds between streamed words")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="stub: share of requests answered 429")
+    parser.add_argument("--retry-after", type=int, default=2, help="stub: Retry-After seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub: share of requests answered 500")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+    if args.output:
+        # run() moves into a scratch directory
+        args.output = os.path.abspath(args.output)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    print(f"{args.users} users, {report['meta']['elapsed_s']}s, "
+          f"{report['throughput']['turns_per_sec']} turns/s, peak RSS {max(report['peak_rss_mb'])} MB", file=sys.stderr)
+    for action, stats in report["actions"].items():
+        print(f"{action:14s} {stats['count']:>6} p50 {stats.get('p50_ms', 0):>8.1f} ms  "
+              f"p95 {stats.get('p95_ms', 0):>8.1f} ms", file=sys.stderr)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Long-term memory across a user's chats.
+
+Two parts: profile facts (name, location, ...) picked up from what the
+user says and stored in the `profile_facts` table, and a BM25 index over
+chunks of the user's own messages in all their chats. Each message is
+indexed as it is appended, and the index is built from the stored chats
+when a user is loaded. recall() returns the best snippets from other
+chats that fit a token budget, for the system prompt.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from context import estimate_tokens
+from search_index import TOKEN_RE
+
+CHUNK_WORDS = 50
+SNIPPET_CHARS = 300
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Too common in chat to say anything about which memory is relevant;
+# contractions are split by TOKEN_RE, hence the lone letters
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been but by can could da did do does
+doing don for from get got had has have he her him his how i if in into is it its just know like ll
+m may maybe me might more must my no not now of ok okay on one or our out re really s said shall she
+should so some t than that the their them then there they this to today too up us ve very was we
+well were what when where which who why will with would yeah yes you your
+""".split())
+
+
+def _terms(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class LongTermMemory:
+
+    def __init__(self, facts=None):
+        self.facts = dict(facts or {})
+        # term -> {chunk id: term frequency}
+        self.postings = defaultdict(dict)
+        # chunk id -> (chat_id, idx, text, length, terms)
+        self.chunks = {}
+        self.chat_chunks = defaultdict(list)
+        self.total_length = 0
+        self._next_id = 0
+
+    @classmethod
+    def from_chats(cls, chats, facts=None):
+        memory = cls(facts)
+        for chat in chats:
+            for idx, message in enumerate(chat["messages"]):
+                memory.add_message(chat["id"], idx, message)
+        return memory
+
+    def update_facts(self, facts):
+        # The facts that are new or changed, for the caller to save
+        changed = {k: v for k, v in facts.items() if self.facts.get(k) != v}
+        self.facts.update(changed)
+        return changed
+
+    def add_message(self, chat_id, idx, message):
+        # Only the user's words; replies would mostly recall themselves
+        if message["role"] != "user":
+            return
+        words = message["content"].split()
+        for start in range(0, len(words), CHUNK_WORDS):
+            text = " ".join(words[start:start + CHUNK_WORDS])
+            terms = _terms(text)
+            if not terms:
+                continue
+            chunk_id = self._next_id
+            self._next_id += 1
+            counts = defaultdict(int)
+            for term in terms:
+                counts[term] += 1
+            for term, count in counts.items():
+                self.postings[term][chunk_id] = count
+            self.chunks[chunk_id] = (chat_id, idx, text, len(terms), tuple(counts))
+            self.chat_chunks[chat_id].append(chunk_id)
+            self.total_length += len(terms)
+
+    def remove_chat(self, chat_id):
+        for chunk_id in self.chat_chunks.pop(chat_id, ()):
+            _, _, _, length, terms = self.chunks.pop(chunk_id)
+            self.total_length -= length
+            for term in terms:
+                posts = self.postings.get(term)
+                if posts is None:
+                    continue
+                posts.pop(chunk_id, None)
+                if not posts:
+                    del self.postings[term]
+
+    def clear(self):
+        # Chats only; profile facts are kept
+        self.postings.clear()
+        self.chunks.clear()
+        self.chat_chunks.clear()
+        self.total_length = 0
+
+    def search(self, query, k=3, exclude_chat=None):
+        # [(score, chat_id, idx, text)], best first
+        n = len(self.chunks)
+        if not n:
+            return []
+        avg_length = self.total_length / n
+        scores = defaultdict(float)
+        for term in set(_terms(query)):
+            posts = self.postings.get(term)
+            if not posts:
+                continue
+            idf = math.log(1 + (n - len(posts) + 0.5) / (len(posts) + 0.5))
+            for chunk_id, tf in posts.items():
+                length = self.chunks[chunk_id][3]
+                scores[chunk_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+        best = heapq.nlargest(k + len(self.chat_chunks.get(exclude_chat, ())), scores.items(), key=lambda x: x[1])
+        results = []
+        for chunk_id, score in best:
+            chat_id, idx, text, _, _ = self.chunks[chunk_id]
+            if chat_id == exclude_chat:
+                continue
+            results.append((score, chat_id, idx, text))
+            if len(results) == k:
+                break
+        return results
+
+    def recall(self, query, k=3, budget=300, exclude_chat=None):
+        # Snippets for the prompt, best first, within `budget` tokens. The
+        # current chat is left out; its history is already in the request.
+        snippets = []
+        used = 0
+        for _, _, _, text in self.search(query, k, exclude_chat):
+            if len(text) > SNIPPET_CHARS:
+                text = text[:SNIPPET_CHARS - 3] + "..."
+            cost = estimate_tokens(text)
+            if used + cost > budget:
+                break
+            snippets.append(text)
+            used += cost
+        return snippets
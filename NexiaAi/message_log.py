@@ -0,0 +1,75 @@
+"""Compact in-memory storage for a chat's messages.
+
+A chat used to hold one {"role", "content"} dict per message, about 200
+bytes of overhead each before any text. A MessageLog keeps two columns
+instead: a bytearray of role codes and a list of the content strings.
+Reading a message hands back a plain dict in the chat completions API
+format, built on the spot, so callers read it the same way as before.
+"""
+
+ROLES = ("user", "assistant", "system")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+
+class MessageLog:
+    __slots__ = ("roles", "contents")
+
+    def __init__(self, messages=()):
+        self.roles = bytearray()
+        self.contents = []
+        for message in messages:
+            self.append(message)
+
+    @classmethod
+    def from_columns(cls, roles, contents):
+        log = cls.__new__(cls)
+        log.roles = bytearray(roles)
+        log.contents = list(contents)
+        return log
+
+    def add(self, role, content):
+        # Content first: readers size the log by its roles, so another
+        # thread never sees a role without its text
+        code = ROLE_CODES[role]
+        self.contents.append(content)
+        self.roles.append(code)
+
+    def append(self, message):
+        self.add(message["role"], message["content"])
+
+    def __len__(self):
+        return len(self.roles)
+
+    def __getitem__(self, index):
+        n = len(self.roles)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(n)
+            return MessageLog.from_columns(self.roles[start:stop:step], self.contents[start:stop:step])
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("message index out of range")
+        return {"role": ROLES[self.roles[index]], "content": self.contents[index]}
+
+    def __iter__(self):
+        for code, content in zip(bytes(self.roles), self.contents):
+            yield {"role": ROLES[code], "content": content}
+
+    def __eq__(self, other):
+        if isinstance(other, MessageLog):
+            return self.roles == other.roles and self.contents == other.contents
+        return list(self) == other
+
+    def __repr__(self):
+        return f"MessageLog({len(self)} messages)"
+
+    def copy(self):
+        return MessageLog.from_columns(self.roles, self.contents[:len(self.roles)])
+
+    def to_api(self):
+        # The list of message dicts the chat completions API expects
+        return list(self)
+
+    def __reduce__(self):
+        # Pickles as one bytes object and one list of strings
+        return (MessageLog.from_columns, (bytes(self.roles), self.contents[:len(self.roles)]))
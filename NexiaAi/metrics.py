@@ -0,0 +1,176 @@
+"""Per-turn timing and request metrics.
+
+A Turn collects how long each stage of one chat turn took (prompt
+building, the Groq round trip, streaming, title, persistence) together
+with the model, status, retries, payload size and token usage. Metrics
+folds finished turns into fixed-bucket histograms, keeps a window of
+recent timings for percentiles, and can write a Prometheus text file
+and a JSON-lines log.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+TOKEN_KINDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+
+class Turn:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.attrs = {"model": None, "status": None, "retries": 0, "payload_bytes": 0}
+        self.usage = {}
+
+    def add(self, stage, seconds):
+        # Stages can run more than once in a turn (one request per model)
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+
+class _Histogram:
+
+    def __init__(self, window):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+        self.buckets[i] += 1
+        self.sum += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in labels.items())
+
+
+class Metrics:
+
+    def __init__(self, prom_path=None, log_path=None, window=500, prom_interval=10.0):
+        self.prom_path = prom_path
+        self.log_path = log_path
+        self.window = window
+        self.prom_interval = prom_interval
+        self._stages = {}
+        self._turns = defaultdict(int)  # (model, status) -> count
+        self._retries = 0
+        self._payload_bytes = 0
+        self._tokens = defaultdict(int)
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._prom_written = 0.0
+
+    def _stage(self, stage):
+        hist = self._stages.get(stage)
+        if hist is None:
+            hist = self._stages[stage] = _Histogram(self.window)
+        return hist
+
+    def observe(self, stage, seconds):
+        # Timings that aren't part of a turn, like drawing the page
+        with self._lock:
+            self._stage(stage).observe(seconds)
+
+    def record_turn(self, turn, **extra):
+        turn.spans["total"] = time.perf_counter() - turn.started
+        attrs = {**turn.attrs, **extra}
+        with self._lock:
+            for stage, seconds in turn.spans.items():
+                self._stage(stage).observe(seconds)
+            self._turns[(attrs["model"] or "none", attrs["status"] or "unknown")] += 1
+            self._retries += attrs["retries"]
+            self._payload_bytes += attrs["payload_bytes"]
+            for kind in TOKEN_KINDS:
+                self._tokens[kind] += turn.usage.get(kind) or 0
+            write_prom = self.prom_path and time.monotonic() - self._prom_written >= self.prom_interval
+            if write_prom:
+                self._prom_written = time.monotonic()
+        if self.log_path:
+            self._log({
+                "ts": datetime.now().isoformat(timespec="milliseconds"),
+                "event": "turn",
+                **attrs,
+                "usage": turn.usage,
+                "spans_ms": {stage: round(seconds * 1000, 2) for stage, seconds in turn.spans.items()},
+            })
+        if write_prom:
+            self.write_prometheus()
+
+    def _log(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._log_lock:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def percentiles(self):
+        # {stage: {"count", "p50_ms", "p95_ms"}} over the recent window
+        with self._lock:
+            result = {}
+            for stage, hist in sorted(self._stages.items()):
+                recent = sorted(hist.recent)
+                if not recent:
+                    continue
+                result[stage] = {
+                    "count": hist.count,
+                    "p50_ms": round(recent[len(recent) // 2] * 1000, 1),
+                    "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1),
+                }
+            return result
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP nexia_stage_seconds Time spent in each stage of a chat turn.",
+            "# TYPE nexia_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, hist in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), hist.buckets):
+                    cumulative += count
+                    lines.append(f"nexia_stage_seconds_bucket{{{_labels(stage=stage, le=bound)}}} {cumulative}")
+                lines.append(f"nexia_stage_seconds_sum{{{_labels(stage=stage)}}} {hist.sum:.6f}")
+                lines.append(f"nexia_stage_seconds_count{{{_labels(stage=stage)}}} {hist.count}")
+            lines += ["# HELP nexia_turns_total Chat turns by answering model and outcome.",
+                      "# TYPE nexia_turns_total counter"]
+            for (model, status), count in sorted(self._turns.items(), key=str):
+                lines.append(f"nexia_turns_total{{{_labels(model=model, status=status)}}} {count}")
+            lines += ["# HELP nexia_model_retries_total Requests that fell back to another model.",
+                      "# TYPE nexia_model_retries_total counter",
+                      f"nexia_model_retries_total {self._retries}",
+                      "# HELP nexia_payload_bytes_total Request body bytes sent to Groq.",
+                      "# TYPE nexia_payload_bytes_total counter",
+                      f"nexia_payload_bytes_total {self._payload_bytes}",
+                      "# HELP nexia_tokens_total Token usage reported by Groq.",
+                      "# TYPE nexia_tokens_total counter"]
+            for kind in TOKEN_KINDS:
+                lines.append(f"nexia_tokens_total{{{_labels(kind=kind.replace('_tokens', ''))}}} {self._tokens[kind]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        # Atomic replace, for node_exporter's textfile collector or any scraper
+        tmp = f"{self.prom_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, self.prom_path)
@@ -0,0 +1,161 @@
+"""Per-model health tracking and circuit breakers for the Groq models.
+
+Shared by every session in the server process, so a model that is
+throttled or failing is skipped straight away instead of being probed
+again on every message. An open breaker lets one probe request through
+once its cooldown is over (half-open); a good answer closes it again.
+"""
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def parse_retry_after(value):
+    # Retry-After is either delay-seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _ModelState:
+
+    def __init__(self, window):
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.opened = 0
+        self.consecutive_failures = 0
+        self.probe_started = None
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.throttled = 0
+        self.last_error = None
+
+
+class ModelHealth:
+
+    def __init__(self, failure_threshold=3, error_rate=0.5, min_samples=6, window=50,
+                 cooldown=15.0, max_cooldown=300.0, probe_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model):
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState(self.window)
+        return state
+
+    def allow(self, model):
+        # True if a request to `model` may go out now. Claims the probe
+        # slot when a breaker is ready to half-open.
+        now = time.monotonic()
+        with self._lock:
+            state = self._get(model)
+            if state.state == CLOSED:
+                return True
+            if state.state == OPEN and now < state.open_until:
+                return False
+            if state.probe_started is not None and now - state.probe_started < self.probe_timeout:
+                return False
+            # Cooldown over, or the last probe never reported back
+            state.state = HALF_OPEN
+            state.probe_started = now
+            return True
+
+    def retry_in(self, models):
+        # Seconds until the first of `models` will take a request again
+        now = time.monotonic()
+        with self._lock:
+            waits = []
+            for model in models:
+                state = self._get(model)
+                if state.state == CLOSED:
+                    return 0.0
+                waits.append(max(0.0, state.open_until - now))
+            return min(waits) if waits else 0.0
+
+    def _open(self, state, seconds):
+        state.opened += 1
+        state.state = OPEN
+        state.open_until = time.monotonic() + seconds
+        state.probe_started = None
+
+    def _backoff(self, state):
+        return min(self.max_cooldown, self.cooldown * 2 ** min(state.opened, 10))
+
+    def record_success(self, model, latency=None):
+        with self._lock:
+            state = self._get(model)
+            if latency is not None:
+                state.latencies.append(latency)
+            state.outcomes.append(True)
+            state.consecutive_failures = 0
+            state.state = CLOSED
+            state.opened = 0
+            state.probe_started = None
+
+    def record_failure(self, model, status=None, retry_after=None, latency=None):
+        with self._lock:
+            state = self._get(model)
+            if latency is not None:
+                state.latencies.append(latency)
+            state.outcomes.append(False)
+            state.consecutive_failures += 1
+            state.last_error = status or "connection"
+            if status == 429:
+                state.throttled += 1
+                self._open(state, retry_after if retry_after is not None else self._backoff(state))
+                return
+            failures = state.outcomes.count(False)
+            if (state.state == HALF_OPEN
+                    or state.consecutive_failures >= self.failure_threshold
+                    or (len(state.outcomes) >= self.min_samples
+                        and failures / len(state.outcomes) >= self.error_rate)):
+                self._open(state, self._backoff(state))
+
+    def record_response(self, model, response):
+        latency = response.elapsed.total_seconds()
+        if response.status_code == 429:
+            self.record_failure(model, 429, parse_retry_after(response.headers.get("Retry-After")), latency)
+        elif response.status_code >= 500:
+            self.record_failure(model, response.status_code, latency=latency)
+        else:
+            # 4xx other than 429 is about our request, not the model's health
+            self.record_success(model, latency)
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for model, state in self._models.items():
+                latencies = sorted(state.latencies)
+                outcomes = len(state.outcomes)
+                result[model] = {
+                    "state": state.state,
+                    "retry_in": round(max(0.0, state.open_until - now), 1) if state.state == OPEN else 0.0,
+                    "error_rate": round(state.outcomes.count(False) / outcomes, 3) if outcomes else 0.0,
+                    "requests": outcomes,
+                    "throttled": state.throttled,
+                    "consecutive_failures": state.consecutive_failures,
+                    "p50_latency": latencies[len(latencies) // 2] if latencies else None,
+                    "last_error": state.last_error,
+                }
+            return result
@@ -0,0 +1,103 @@
+"""Bulk maintenance for the Nexia database, without Streamlit.
+
+    python nexia_cli.py retitle                  # recompute every chat title
+    python nexia_cli.py moods [--all]            # label user messages with their mood
+    python nexia_cli.py migrate users_db.pkl     # merge an old pickle database
+    python nexia_cli.py --workers 8 --db other.db retitle
+
+Chats and messages are streamed out of SQLite in batches, analysed in a
+process pool and written back one transaction per batch. Run it while
+the app is stopped: a running app keeps its own copy of signed-in users'
+chats and would write its old titles back.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import storage
+from analysis import detect_mood, refresh_chat_title
+
+
+def retitle_batch(batch):
+    # Runs in a worker. Returns (email, chat) with a fresh title and title state.
+    for email, chat in batch:
+        chat.pop("title_state", None)
+        chat["title"] = refresh_chat_title(chat)
+    return batch
+
+
+def mood_batch(rows):
+    # Runs in a worker. (email, chat_id, idx, content) -> (mood, email, chat_id, idx)
+    return [(detect_mood(content), email, chat_id, idx) for email, chat_id, idx, content in rows]
+
+
+def _split(batch, parts):
+    size = max(1, -(-len(batch) // parts))
+    return [batch[i:i + size] for i in range(0, len(batch), size)]
+
+
+def _run(pool, func, batches, write, workers):
+    # Keeps a few batches in flight so reading, analysis and writing overlap
+    done = 0
+    pending = []
+    for batch in batches:
+        pending.append(pool.submit(func, batch))
+        if len(pending) > workers * 2:
+            result = pending.pop(0).result()
+            write(result)
+            done += len(result)
+    for future in pending:
+        result = future.result()
+        write(result)
+        done += len(result)
+    return done
+
+
+def retitle(args, pool):
+    batches = (part for batch in storage.iter_chats(args.batch_size) for part in _split(batch, args.workers))
+    return _run(pool, retitle_batch, batches, storage.update_chat_titles, args.workers), "chats"
+
+
+def moods(args, pool):
+    batches = storage.iter_user_messages(args.batch_size * 10, only_unlabelled=not args.all)
+    return _run(pool, mood_batch, batches, storage.set_message_moods, args.workers), "messages"
+
+
+def migrate(args, pool):
+    users, chats = storage.import_legacy(args.path)
+    print(f"Imported {users} users and {chats} chats from {args.path}", file=sys.stderr)
+    if args.retitle:
+        return retitle(args, pool)
+    return chats, "chats"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="database file (default: NEXIA_DB_PATH or nexia.db)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--batch-size", type=int, default=500, help="chats read per batch")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("retitle", help="recompute every chat title from its messages")
+    moods_parser = commands.add_parser("moods", help="backfill mood labels on user messages")
+    moods_parser.add_argument("--all", action="store_true", help="relabel messages that already have a mood")
+    migrate_parser = commands.add_parser("migrate", help="merge a legacy users_db.pkl into the database")
+    migrate_parser.add_argument("path")
+    migrate_parser.add_argument("--retitle", action="store_true", help="retitle all chats afterwards")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        storage.DB_FILE = args.db
+    command = {"retitle": retitle, "moods": moods, "migrate": migrate}[args.command]
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        count, unit = command(args, pool)
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed else 0
+    print(f"{args.command}: {count} {unit} in {elapsed:.2f}s ({rate:,.0f} {unit}/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
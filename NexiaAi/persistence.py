@@ -0,0 +1,233 @@
+"""Write-behind queue for chat writes.
+
+The UI updates session state, hands the change to this queue and moves
+on; a background thread writes it to SQLite. Saves of the same chat
+that pile up before a flush collapse into one write of its latest
+state, and each flush is a single transaction, so a crash loses at most
+the last interval of changes and never leaves a chat half written.
+"""
+import atexit
+import copy
+import threading
+import time
+from collections import OrderedDict, deque
+
+import storage
+
+_queues = []
+
+INSIGHTS = "insights"
+FACTS = "facts"
+# Per-user records that writes replacing all of a user's chats leave alone
+USER_RECORDS = (INSIGHTS, FACTS)
+
+
+def flush_pending(email=None, timeout=5.0):
+    # Waits for queued writes (for one user, or everyone) to reach the
+    # database, so a fresh load sees them
+    for queue in list(_queues):
+        queue.flush(email, timeout)
+
+
+def _snapshot(chat):
+    # The session keeps changing its chat dicts after handing them over.
+    # Messages are only ever appended, so a shallow copy of the log is enough.
+    # The live chat's message_count moves on to what the snapshot holds, so
+    # the next save only carries messages appended after this one.
+    snapshot = {k: v.copy() if k == "messages" else copy.deepcopy(v) for k, v in chat.items()}
+    snapshot["message_count"] = chat.get("message_count", 0)
+    chat["message_count"] = len(snapshot["messages"])
+    return snapshot
+
+
+def _keep_unwritten(old, new):
+    # `new` replaces `old` before it was written, so it has to write the
+    # messages (or add the insight counts) `old` would have as well
+    if old[0] == "save_chat" and new[0] == "save_chat":
+        new[2]["message_count"] = min(new[2]["message_count"], old[2]["message_count"])
+    elif old[0] == "save_insights" and new[0] == "save_insights":
+        new[2].merge(old[2])
+    elif old[0] == "save_facts" and new[0] == "save_facts":
+        # The newer change to a fact wins
+        facts, removed = new[2]
+        old_facts, old_removed = old[2]
+        removed.update(fact for fact in old_removed if fact not in facts)
+        for fact, value in old_facts.items():
+            if fact not in facts and fact not in removed:
+                facts[fact] = value
+
+
+class WriteBehindQueue:
+
+    def __init__(self, max_pending=1000, interval=0.5):
+        self.max_pending = max_pending
+        self.interval = interval
+        # (email, chat_id) -> op for single-chat writes, (email, None) for
+        # writes that replace all of a user's chats, (email, INSIGHTS) and
+        # (email, FACTS) for the user's rollups and profile facts
+        self._pending = OrderedDict()
+        self._writing = set()
+        self._cond = threading.Condition()
+        self._urgent = False
+        self._closed = False
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        self.last_error = None
+        self.latencies = deque(maxlen=200)
+        self._thread = threading.Thread(target=self._run, name="nexia-write-behind", daemon=True)
+        self._thread.start()
+        _queues.append(self)
+        atexit.register(self.close)
+
+    def save_chat(self, email, chat):
+        # Under the lock, so two sessions saving the same chat can't both
+        # claim its new messages
+        with self._cond:
+            self._put((email, chat["id"]), ("save_chat", email, _snapshot(chat)))
+
+    def delete_chat(self, email, chat_id):
+        self._put((email, chat_id), ("delete_chat", email, chat_id))
+
+    def delete_all_chats(self, email):
+        self._put((email, None), ("delete_all_chats", email, None))
+
+    def save_insights(self, email, unsaved):
+        # `unsaved` is a UserInsights of counts to add to the stored ones;
+        # the queue owns it from here
+        self._put((email, INSIGHTS), ("save_insights", email, unsaved))
+
+    def save_facts(self, email, facts, removed=()):
+        # Writes only the facts given and deletes only those in `removed`,
+        # so facts another process saved meanwhile are left alone
+        removed = {fact for fact in removed if fact not in facts}
+        self._put((email, FACTS), ("save_facts", email, (dict(facts), removed)))
+
+    def _put(self, key, op):
+        with self._cond:
+            if self._closed:
+                storage.apply_writes([op])
+                return
+            self.enqueued += 1
+            email, chat_id = key
+            if chat_id is None:
+                # Replaces every chat write queued for this user
+                stale = [k for k in self._pending if k[0] == email and k[1] not in USER_RECORDS]
+                for k in stale:
+                    _keep_unwritten(self._pending.pop(k), op)
+                self.coalesced += len(stale)
+            elif key in self._pending:
+                # Keeps its place in line, so new chats still land in creation order
+                _keep_unwritten(self._pending[key], op)
+                self._pending[key] = op
+                self.coalesced += 1
+                return
+            while len(self._pending) >= self.max_pending and not self._closed:
+                # Full: have the writer flush now and wait for room
+                self._urgent = True
+                self._cond.notify_all()
+                self._cond.wait(self.interval)
+            self._pending[key] = op
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._urgent and not self._closed:
+                    self._cond.wait(self.interval)
+                self._urgent = False
+                if not self._pending:
+                    if self._closed:
+                        return
+                    continue
+                batch = list(self._pending.items())
+                self._pending.clear()
+                self._writing = {key[0] for key, _ in batch}
+                self._cond.notify_all()
+
+            started = time.perf_counter()
+            try:
+                storage.apply_writes([op for _, op in batch])
+                error = None
+            except Exception as e:
+                error = e
+            latency = time.perf_counter() - started
+
+            with self._cond:
+                self._writing = set()
+                if error is None:
+                    self.flushes += 1
+                    self.written += len(batch)
+                    self.latencies.append(latency)
+                else:
+                    self.errors += 1
+                    self.last_error = repr(error)
+                    if not self._closed:
+                        self._requeue(batch)
+                self._cond.notify_all()
+
+    def _requeue(self, batch):
+        # Failed writes go back in front of anything queued since, unless
+        # a newer write for the same chat or user already replaces them
+        merged = OrderedDict()
+        for key, op in batch:
+            newer = self._pending.get(key)
+            if newer is None and key[1] not in USER_RECORDS:
+                newer = self._pending.get((key[0], None))
+            if newer is None:
+                merged[key] = op
+            else:
+                _keep_unwritten(op, newer)
+        merged.update(self._pending)
+        self._pending = merged
+
+    def _busy(self, email):
+        if email is None:
+            return bool(self._pending or self._writing)
+        return email in self._writing or any(k[0] == email for k in self._pending)
+
+    def pending(self, email=None):
+        # True while writes for `email` are queued or being written
+        with self._cond:
+            return self._busy(email)
+
+    def flush(self, email=None, timeout=5.0):
+        # True once nothing is queued or being written for `email`
+        with self._cond:
+            if not self._busy(email):
+                return True
+            self._urgent = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._busy(email), timeout)
+
+    def close(self, timeout=10.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self in _queues:
+            _queues.remove(self)
+
+    def stats(self):
+        with self._cond:
+            latencies = sorted(self.latencies)
+
+            def percentile(p):
+                if not latencies:
+                    return None
+                return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+            return {
+                "queue_depth": len(self._pending),
+                "max_pending": self.max_pending,
+                "enqueued": self.enqueued,
+                "coalesced": self.coalesced,
+                "flushes": self.flushes,
+                "written": self.written,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "last_flush_ms": round(self.latencies[-1] * 1000, 2) if self.latencies else None,
+                "p50_flush_ms": percentile(0.5),
+                "p95_flush_ms": percentile(0.95),
+            }
@@ -0,0 +1,140 @@
+"""Server-wide token-bucket rate limiting for the shared Groq API key.
+
+Bucket state lives in a small SQLite file, so every session in every
+Streamlit process on the host draws from the same requests-per-minute
+and tokens-per-minute budget. Each user also has a bucket refilled at
+their weighted fair share of the request rate, split between the users
+active in the last minute, so one heavy user can't starve the rest.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+LIMITS_DB_FILE = os.environ.get("NEXIA_LIMITS_DB_PATH", "nexia_limits.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS active_users (
+    email TEXT PRIMARY KEY,
+    weight REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class RateLimiter:
+
+    def __init__(self, rpm=30, tpm=6000, user_rpm=10, active_window=60.0, path=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.user_rpm = user_rpm
+        self.active_window = active_window
+        self.path = os.path.abspath(path or LIMITS_DB_FILE)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _take(self, conn, name, capacity, per_second, now):
+        # Refilled level of a bucket; new buckets start full
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return capacity
+        tokens, updated = row
+        return min(capacity, tokens + max(0.0, now - updated) * per_second)
+
+    def _store(self, conn, name, tokens, now):
+        conn.execute(
+            "INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+            (name, tokens, now)
+        )
+
+    def _user_share(self, conn, email, weight, now):
+        # Requests per minute this user may make right now
+        conn.execute(
+            "INSERT INTO active_users (email, weight, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(email) DO UPDATE SET weight = excluded.weight, last_seen = excluded.last_seen",
+            (email, weight, now)
+        )
+        total = conn.execute(
+            "SELECT SUM(weight) FROM active_users WHERE last_seen >= ?", (now - self.active_window,)
+        ).fetchone()[0] or weight
+        return min(self.user_rpm, self.rpm * weight / total)
+
+    def acquire(self, email, tokens, weight=1.0):
+        # Takes one request and `tokens` estimated tokens if everything has
+        # room. Returns (allowed, seconds to wait, "user" or "server").
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM active_users WHERE last_seen < ?", (now - 3600,))
+            share = self._user_share(conn, email, weight, now)
+            tokens = min(tokens, self.tpm)
+            user_name = f"user:{email}"
+            user_level = self._take(conn, user_name, max(1.0, share), share / 60, now)
+            rpm_level = self._take(conn, "global:rpm", self.rpm, self.rpm / 60, now)
+            tpm_level = self._take(conn, "global:tpm", self.tpm, self.tpm / 60, now)
+
+            user_wait = max(0.0, (1 - user_level) * 60 / share)
+            server_wait = max((1 - rpm_level) * 60 / self.rpm, (tokens - tpm_level) * 60 / self.tpm, 0.0)
+            allowed = user_wait == 0 and server_wait == 0
+            if allowed:
+                user_level -= 1
+                rpm_level -= 1
+                tpm_level -= tokens
+            self._store(conn, user_name, user_level, now)
+            self._store(conn, "global:rpm", rpm_level, now)
+            self._store(conn, "global:tpm", tpm_level, now)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if allowed:
+            return True, 0.0, ""
+        if user_wait >= server_wait:
+            return False, user_wait, "user"
+        return False, server_wait, "server"
+
+    def settle(self, estimated_tokens, actual_tokens):
+        # Corrects the token bucket once the real usage is known
+        delta = actual_tokens - estimated_tokens
+        if not delta:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            level = self._take(conn, "global:tpm", self.tpm, self.tpm / 60, now)
+            self._store(conn, "global:tpm", level - delta, now)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def stats(self):
+        now = time.time()
+        conn = self._connect()
+        active = conn.execute(
+            "SELECT COUNT(*) FROM active_users WHERE last_seen >= ?", (now - self.active_window,)
+        ).fetchone()[0]
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "requests_left": round(self._take(conn, "global:rpm", self.rpm, self.rpm / 60, now), 2),
+            "tokens_left": round(self._take(conn, "global:tpm", self.tpm, self.tpm / 60, now)),
+            "active_users": active,
+        }
@@ -0,0 +1,94 @@
+"""Per-user inverted index for chat search.
+
+Maps each lowercase word to the (chat id, message index) pairs it
+appears in. A query only looks at the vocabulary and the candidate
+messages it points to, then confirms the substring match on those, so
+results are the same as the old full scan.
+"""
+import re
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+class SearchIndex:
+
+    def __init__(self, postings=None):
+        # token -> {(chat_id, idx)}, plus chat_id -> tokens so deletes stay cheap
+        self.postings = defaultdict(set)
+        self.chat_tokens = defaultdict(set)
+        for token, chat_id, idx in postings or ():
+            self.postings[token].add((chat_id, idx))
+            self.chat_tokens[chat_id].add(token)
+
+    @classmethod
+    def from_chats(cls, chats):
+        index = cls()
+        for chat in chats:
+            for idx, message in enumerate(chat["messages"]):
+                index.add_message(chat["id"], idx, message["content"])
+        return index
+
+    def add_message(self, chat_id, idx, content):
+        for token in tokenize(content):
+            self.postings[token].add((chat_id, idx))
+            self.chat_tokens[chat_id].add(token)
+
+    def remove_chat(self, chat_id):
+        for token in self.chat_tokens.pop(chat_id, ()):
+            posts = self.postings.get(token)
+            if posts is None:
+                continue
+            posts.difference_update([p for p in posts if p[0] == chat_id])
+            if not posts:
+                del self.postings[token]
+
+    def clear(self):
+        self.postings.clear()
+        self.chat_tokens.clear()
+
+    def _candidates(self, terms):
+        candidates = None
+        for term in terms:
+            # A query word can sit inside a longer stored word, so match on the vocabulary
+            hits = set()
+            for token, posts in self.postings.items():
+                if term in token:
+                    hits |= posts
+            candidates = hits if candidates is None else candidates & hits
+            if not candidates:
+                break
+        return candidates or set()
+
+    def search(self, query, chats, by_id=None):
+        # Returns (matching chats in list order, {chat_id: [message indices]}).
+        # by_id is the caller's id -> chat index, if it keeps one.
+        query_lower = query.lower()
+        terms = TOKEN_RE.findall(query_lower)
+        matches = defaultdict(list)
+        if terms:
+            if by_id is None:
+                by_id = {chat["id"]: chat for chat in chats}
+            for chat_id, idx in self._candidates(set(terms)):
+                chat = by_id.get(chat_id)
+                if chat is not None and idx < len(chat["messages"]) and query_lower in chat["messages"][idx]["content"].lower():
+                    matches[chat_id].append(idx)
+        else:
+            # Punctuation-only queries have no words to look up
+            for chat in chats:
+                for idx, message in enumerate(chat["messages"]):
+                    if query_lower in message["content"].lower():
+                        matches[chat["id"]].append(idx)
+
+        filtered_chats = []
+        search_highlights = {}
+        for chat in chats:
+            title_match = query_lower in chat["title"].lower()
+            if title_match or chat["id"] in matches:
+                filtered_chats.append(chat)
+                search_highlights[chat["id"]] = sorted(matches.get(chat["id"], []))
+        return filtered_chats, search_highlights
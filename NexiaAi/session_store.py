@@ -0,0 +1,149 @@
+"""Sign-in sessions keyed by a random per-browser token.
+
+Each sign-in gets its own unguessable token, so one browser's session
+never signs another browser in. Sessions live in the `sessions` table,
+which stores only a hash of the token, with an LRU of recently used
+tokens in front of it so a lookup is a dict hit on most reruns. Expiry
+slides: any use pushes it `ttl` seconds out. The new expiry is written
+back at most every `refresh_interval` seconds, so an active session
+doesn't write to the database on every rerun. A cached session is checked
+against its row at least every `check_interval` seconds, so a sign-out
+handled by another process takes effect here too. A background thread
+deletes expired rows.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import storage
+
+
+def _hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionStore:
+
+    def __init__(self, ttl=86400, max_cached=10000, sweep_interval=300, refresh_interval=None, check_interval=60):
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self.sweep_interval = sweep_interval
+        self.refresh_interval = ttl / 24 if refresh_interval is None else refresh_interval
+        self.check_interval = min(check_interval, self.refresh_interval)
+        # token hash -> [email, expires_at, stored expires_at, checked_at],
+        # least recently used first
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.checks = 0
+        self.swept = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="nexia-session-sweep", daemon=True)
+        self._thread.start()
+
+    def create(self, email):
+        token = secrets.token_urlsafe(32)
+        key = _hash(token)
+        expires = time.time() + self.ttl
+        storage.save_session(key, email, expires)
+        with self._lock:
+            self._remember(key, [email, expires, expires, time.time()])
+        return token
+
+    def get(self, token):
+        # The signed-in email, or None if the token is unknown or expired.
+        # A hit slides the expiry forward.
+        if not token:
+            return None
+        key = _hash(token)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            self.misses += 1
+            row = storage.get_session(key)
+            if row is None:
+                return None
+            entry = [row[0], row[1], row[1], now]
+            with self._lock:
+                self._remember(key, entry)
+        elif now - entry[3] >= self.check_interval:
+            # Revoked or slid forward by another process since we last looked
+            self.checks += 1
+            row = storage.get_session(key)
+            if row is None:
+                self._forget(key)
+                return None
+            entry[1] = max(entry[1], row[1])
+            entry[2] = row[1]
+            entry[3] = now
+        if entry[1] <= now:
+            self.revoke(token)
+            return None
+        entry[1] = now + self.ttl
+        if entry[1] - entry[2] >= self.refresh_interval:
+            entry[2] = entry[1]
+            # Only updates the row, so a session revoked meanwhile stays revoked
+            if not storage.touch_session(key, entry[1]):
+                self._forget(key)
+                return None
+        return entry[0]
+
+    def revoke(self, token):
+        key = _hash(token)
+        self._forget(key)
+        storage.delete_session(key)
+
+    def _forget(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def _remember(self, key, entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._cache.items() if entry[1] <= now]
+            for key in expired:
+                del self._cache[key]
+            # Still in use, but the row's expiry hasn't caught up yet
+            behind = [(key, entry) for key, entry in self._cache.items() if entry[2] <= now]
+        # Written back first so the delete below only removes idle sessions
+        for key, entry in behind:
+            entry[2] = entry[1]
+            if not storage.touch_session(key, entry[1]):
+                self._forget(key)
+        removed = storage.delete_expired_sessions(now)
+        self.swept += removed
+        return removed
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                pass
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "max_cached": self.max_cached,
+                "hits": self.hits,
+                "misses": self.misses,
+                "checks": self.checks,
+                "swept": self.swept,
+            }
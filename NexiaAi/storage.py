@@ -0,0 +1,564 @@
+"""SQLite storage for Nexia users and chats.
+
+One row per user, per chat and per message, so appending a message only
+writes that message. The database runs in WAL mode which lets several
+Streamlit processes read and write the same file safely.
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from analysis import detect_mood
+from insights import UserInsights
+from message_log import MessageLog
+from search_index import tokenize
+
+DB_FILE = os.environ.get("NEXIA_DB_PATH", "nexia.db")
+LEGACY_DB_FILE = "users_db.pkl"
+
+# Chat keys stored in their own columns; anything else goes into `meta`.
+# A chat's `message_count` is how many of its messages are already stored.
+CHAT_COLUMNS = ("id", "title", "messages", "created_at", "message_count")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chats (
+    email TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    meta TEXT NOT NULL DEFAULT '{}',
+    message_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (email, id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    email TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    mood TEXT,
+    PRIMARY KEY (email, chat_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS search_terms (
+    email TEXT NOT NULL,
+    token TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    PRIMARY KEY (email, token, chat_id, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS search_terms_chat ON search_terms (email, chat_id, idx);
+CREATE TABLE IF NOT EXISTS insights (
+    email TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profile_facts (
+    email TEXT NOT NULL,
+    fact TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (email, fact)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sessions (
+    token_hash TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def _connect():
+    # Streamlit runs each session in its own thread, so keep one connection per thread
+    path = os.path.abspath(DB_FILE)
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == path:
+        return conn
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    _local.conn = conn
+    _local.path = path
+    with _init_lock:
+        if path not in _initialized:
+            _init_db(conn)
+            _initialized.add(path)
+    return conn
+
+
+@contextmanager
+def _transaction():
+    conn = _connect()
+    # IMMEDIATE takes the write lock up front so concurrent writers queue on busy_timeout
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+def _init_db(conn):
+    conn.executescript(SCHEMA)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Databases from before mood labels; old rows stay NULL until nexia_cli.py backfills them
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+        if "mood" not in columns:
+            conn.execute("ALTER TABLE messages ADD COLUMN mood TEXT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        empty = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+        if empty and os.path.exists(LEGACY_DB_FILE):
+            _import_legacy_pickle(conn, LEGACY_DB_FILE)
+        if conn.execute("SELECT 1 FROM search_terms LIMIT 1").fetchone() is None:
+            _backfill_search_terms(conn)
+        conn.execute(
+            "INSERT OR IGNORE INTO users (email, password, created_at) VALUES (?, ?, ?)",
+            ("demo@nexia.ai", "demo123", datetime.now().isoformat())
+        )
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _read_legacy_pickle(path):
+    with open(path, 'rb') as f:
+        users_db = pickle.load(f)
+    for user in users_db.values():
+        # Old builds numbered chats len(chats) + 1, which repeats an id after a delete
+        chats = user.get("chats", [])
+        next_id = max((chat["id"] for chat in chats), default=0) + 1
+        seen = set()
+        for chat in chats:
+            if chat["id"] in seen:
+                chat["id"] = next_id
+                next_id += 1
+            seen.add(chat["id"])
+    return users_db
+
+
+def _import_legacy_pickle(conn, path):
+    # One-time migration from the old whole-database pickle
+    try:
+        users_db = _read_legacy_pickle(path)
+    except Exception:
+        return
+    for email, user in users_db.items():
+        _write_user(conn, email, user)
+
+
+def _backfill_search_terms(conn):
+    # Databases created before the search index existed
+    rows = conn.execute("SELECT email, chat_id, idx, content FROM messages").fetchall()
+    for email, chat_id, idx, content in rows:
+        _index_message(conn, email, chat_id, idx, content)
+
+
+def _index_message(conn, email, chat_id, idx, content):
+    conn.executemany(
+        "INSERT OR IGNORE INTO search_terms (email, token, chat_id, idx) VALUES (?, ?, ?, ?)",
+        [(email, token, chat_id, idx) for token in tokenize(content)]
+    )
+
+
+def _write_user(conn, email, user):
+    conn.execute(
+        "INSERT INTO users (email, password, created_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(email) DO UPDATE SET password = excluded.password",
+        (email, user["password"], user.get("created_at") or datetime.now().isoformat())
+    )
+    _sync_chats(conn, email, user.get("chats", []))
+
+
+def _chat_meta(chat):
+    return json.dumps({k: v for k, v in chat.items() if k not in CHAT_COLUMNS}, sort_keys=True)
+
+
+def _write_chat(conn, email, chat, stored):
+    # `stored` is the existing (title, meta, message_count) row or None.
+    # Messages are only ever appended, so the ones past chat["message_count"]
+    # are new and go after whatever is stored now. A copy that missed
+    # another process's messages then adds its own after them instead of
+    # dropping them.
+    messages = chat["messages"]
+    meta = _chat_meta(chat)
+    stored_count = 0
+    new = messages
+    if stored is None:
+        conn.execute(
+            "INSERT INTO chats (email, id, title, created_at, meta, message_count) VALUES (?, ?, ?, ?, ?, ?)",
+            (email, chat["id"], chat["title"], chat.get("created_at") or datetime.now().isoformat(), meta, len(messages))
+        )
+    else:
+        title, stored_meta, stored_count = stored
+        base = chat.get("message_count")
+        if base is None or base > len(messages):
+            # No record of what was stored (scripts, legacy imports): the copy is the whole chat
+            if len(messages) < stored_count:
+                conn.execute(
+                    "DELETE FROM messages WHERE email = ? AND chat_id = ? AND idx >= ?",
+                    (email, chat["id"], len(messages))
+                )
+                conn.execute(
+                    "DELETE FROM search_terms WHERE email = ? AND chat_id = ? AND idx >= ?",
+                    (email, chat["id"], len(messages))
+                )
+                stored_count = len(messages)
+            base = stored_count
+        new = messages[base:]
+        if (title, stored_meta, stored_count) != (chat["title"], meta, stored_count + len(new)):
+            conn.execute(
+                "UPDATE chats SET title = ?, meta = ?, message_count = ? WHERE email = ? AND id = ?",
+                (chat["title"], meta, stored_count + len(new), email, chat["id"])
+            )
+    if len(new):
+        conn.executemany(
+            "INSERT OR REPLACE INTO messages (email, chat_id, idx, role, content, mood) VALUES (?, ?, ?, ?, ?, ?)",
+            [(email, chat["id"], i, msg["role"], msg["content"], detect_mood(msg["content"]) if msg["role"] == "user" else None)
+             for i, msg in enumerate(new, start=stored_count)]
+        )
+        for i, msg in enumerate(new, start=stored_count):
+            _index_message(conn, email, chat["id"], i, msg["content"])
+
+
+def _sync_chats(conn, email, chats):
+    stored = {
+        row[0]: row[1:]
+        for row in conn.execute("SELECT id, title, meta, message_count FROM chats WHERE email = ?", (email,))
+    }
+    keep = {chat["id"] for chat in chats}
+    for chat_id in stored.keys() - keep:
+        _delete_chat(conn, email, chat_id)
+    # Chats are listed newest first; insert oldest first so rowid order matches
+    for chat in reversed(chats):
+        _write_chat(conn, email, chat, stored.get(chat["id"]))
+
+
+def _delete_chat(conn, email, chat_id):
+    conn.execute("DELETE FROM search_terms WHERE email = ? AND chat_id = ?", (email, chat_id))
+    conn.execute("DELETE FROM messages WHERE email = ? AND chat_id = ?", (email, chat_id))
+    conn.execute("DELETE FROM chats WHERE email = ? AND id = ?", (email, chat_id))
+
+
+def get_user(email):
+    row = _connect().execute(
+        "SELECT password, created_at FROM users WHERE email = ?", (email,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"password": row[0], "created_at": row[1]}
+
+
+def create_user(email, password):
+    with _transaction() as conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO users (email, password, created_at) VALUES (?, ?, ?)",
+            (email, password, datetime.now().isoformat())
+        )
+        return cur.rowcount == 1
+
+
+def load_chats(email):
+    conn = _connect()
+    chats = []
+    by_id = {}
+    for chat_id, title, created_at, meta in conn.execute(
+        "SELECT id, title, created_at, meta FROM chats WHERE email = ? ORDER BY rowid DESC", (email,)
+    ):
+        chat = {"id": chat_id, "title": title, "messages": MessageLog(), "created_at": created_at}
+        chat.update(json.loads(meta))
+        chats.append(chat)
+        by_id[chat_id] = chat
+    for chat_id, role, content in conn.execute(
+        "SELECT chat_id, role, content FROM messages WHERE email = ? ORDER BY chat_id, idx", (email,)
+    ):
+        chat = by_id.get(chat_id)
+        if chat is not None:
+            chat["messages"].add(role, content)
+    for chat in chats:
+        chat["message_count"] = len(chat["messages"])
+    return chats
+
+
+def chat_counts(email):
+    # (chats, messages) stored for the user, to tell whether a copy is current
+    return _connect().execute(
+        "SELECT COUNT(*), COALESCE(SUM(message_count), 0) FROM chats WHERE email = ?", (email,)
+    ).fetchone()
+
+
+def iter_user_chats(email, batch_size=100):
+    # Yields one user's chats oldest first, holding a batch of chat rows and
+    # one chat's messages at a time rather than the whole history
+    conn = _connect()
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT rowid, id, title, created_at, meta FROM chats WHERE email = ? AND rowid > ? "
+            "ORDER BY rowid LIMIT ?", (email, last, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        for _, chat_id, title, created_at, meta in rows:
+            chat = {"id": chat_id, "title": title, "messages": MessageLog(), "created_at": created_at}
+            chat.update(json.loads(meta))
+            for role, content in conn.execute(
+                "SELECT role, content FROM messages WHERE email = ? AND chat_id = ? ORDER BY idx", (email, chat_id)
+            ):
+                chat["messages"].add(role, content)
+            yield chat
+        last = rows[-1][0]
+
+
+def load_search_terms(email):
+    # (token, chat_id, idx) rows for building the user's SearchIndex
+    return _connect().execute(
+        "SELECT token, chat_id, idx FROM search_terms WHERE email = ?", (email,)
+    ).fetchall()
+
+
+def _save_chat(conn, email, chat):
+    stored = conn.execute(
+        "SELECT title, meta, message_count FROM chats WHERE email = ? AND id = ?",
+        (email, chat["id"])
+    ).fetchone()
+    _write_chat(conn, email, chat, stored)
+
+
+def load_insights(email):
+    # The serialized UserInsights blob, or None before the first save
+    row = _connect().execute("SELECT data FROM insights WHERE email = ?", (email,)).fetchone()
+    return row[0] if row else None
+
+
+def init_insights(email, data):
+    # Stores a user's first rollups unless another process already did;
+    # returns the stored blob either way
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO insights (email, data, updated_at) VALUES (?, ?, ?)",
+            (email, data, datetime.now().isoformat())
+        )
+        return conn.execute("SELECT data FROM insights WHERE email = ?", (email,)).fetchone()[0]
+
+
+def _save_insights(conn, email, unsaved):
+    # Adds a UserInsights of new counts to the stored rollups. The read and
+    # write share the write transaction, so processes counting for the same
+    # user add up rather than overwrite each other.
+    row = conn.execute("SELECT data FROM insights WHERE email = ?", (email,)).fetchone()
+    insights = UserInsights.from_bytes(row[0]) if row else UserInsights()
+    conn.execute(
+        "INSERT INTO insights (email, data, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(email) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+        (email, insights.merge(unsaved).to_bytes(), datetime.now().isoformat())
+    )
+
+
+def load_profile_facts(email):
+    return dict(_connect().execute("SELECT fact, value FROM profile_facts WHERE email = ?", (email,)))
+
+
+def _save_profile_facts(conn, email, facts, removed):
+    # Upserts each fact in `facts` and deletes those in `removed`; the
+    # user's other facts are left as stored
+    conn.executemany(
+        "DELETE FROM profile_facts WHERE email = ? AND fact = ?",
+        [(email, fact) for fact in removed]
+    )
+    now = datetime.now().isoformat()
+    conn.executemany(
+        "INSERT INTO profile_facts (email, fact, value, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(email, fact) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+        [(email, fact, value, now) for fact, value in facts.items()]
+    )
+
+
+def _delete_all_chats(conn, email):
+    conn.execute("DELETE FROM search_terms WHERE email = ?", (email,))
+    conn.execute("DELETE FROM messages WHERE email = ?", (email,))
+    conn.execute("DELETE FROM chats WHERE email = ?", (email,))
+
+
+def save_chat(email, chat):
+    # Writes the chat row if it changed plus only the messages not yet stored.
+    # The caller should then set chat["message_count"] to len(chat["messages"]).
+    with _transaction() as conn:
+        _save_chat(conn, email, chat)
+
+
+def delete_chat(email, chat_id):
+    with _transaction() as conn:
+        _delete_chat(conn, email, chat_id)
+
+
+def delete_all_chats(email):
+    with _transaction() as conn:
+        _delete_all_chats(conn, email)
+
+
+def apply_writes(ops):
+    # Runs (kind, email, arg) writes from the write-behind queue in order,
+    # all in one transaction so a crash leaves either all or none of them
+    with _transaction() as conn:
+        for kind, email, arg in ops:
+            if kind == "save_chat":
+                _save_chat(conn, email, arg)
+            elif kind == "delete_chat":
+                _delete_chat(conn, email, arg)
+            elif kind == "delete_all_chats":
+                _delete_all_chats(conn, email)
+            elif kind == "save_insights":
+                _save_insights(conn, email, arg)
+            elif kind == "save_facts":
+                _save_profile_facts(conn, email, *arg)
+            else:
+                raise ValueError(f"Unknown write: {kind}")
+
+
+# Sign-in sessions, keyed by a hash of the browser's token
+def get_session(token_hash):
+    # (email, expires_at) or None
+    return _connect().execute(
+        "SELECT email, expires_at FROM sessions WHERE token_hash = ?", (token_hash,)
+    ).fetchone()
+
+
+def save_session(token_hash, email, expires_at):
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT INTO sessions (token_hash, email, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(token_hash) DO UPDATE SET expires_at = excluded.expires_at",
+            (token_hash, email, expires_at)
+        )
+
+
+def touch_session(token_hash, expires_at):
+    # Slides an existing session's expiry; False if it was revoked
+    with _transaction() as conn:
+        return conn.execute(
+            "UPDATE sessions SET expires_at = ? WHERE token_hash = ?", (expires_at, token_hash)
+        ).rowcount == 1
+
+
+def delete_session(token_hash):
+    with _transaction() as conn:
+        conn.execute("DELETE FROM sessions WHERE token_hash = ?", (token_hash,))
+
+
+def delete_expired_sessions(now):
+    with _transaction() as conn:
+        return conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+
+
+# Bulk helpers for nexia_cli.py; they stream in batches instead of loading everything
+def iter_chats(batch_size=500):
+    # Yields lists of (email, chat), in (email, id) order
+    conn = _connect()
+    last = ("", -1)
+    while True:
+        rows = conn.execute(
+            "SELECT email, id, title, created_at, meta FROM chats WHERE (email, id) > (?, ?) "
+            "ORDER BY email, id LIMIT ?", (*last, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        batch = []
+        for email, chat_id, title, created_at, meta in rows:
+            chat = {"id": chat_id, "title": title, "messages": MessageLog(), "created_at": created_at}
+            chat.update(json.loads(meta))
+            for role, content in conn.execute(
+                "SELECT role, content FROM messages WHERE email = ? AND chat_id = ? ORDER BY idx", (email, chat_id)
+            ):
+                chat["messages"].add(role, content)
+            batch.append((email, chat))
+        yield batch
+        last = rows[-1][:2]
+
+
+def update_chat_titles(items):
+    # items: (email, chat) pairs; only the title and meta columns are written
+    with _transaction() as conn:
+        conn.executemany(
+            "UPDATE chats SET title = ?, meta = ? WHERE email = ? AND id = ?",
+            [(chat["title"], _chat_meta(chat), email, chat["id"]) for email, chat in items]
+        )
+
+
+def iter_user_messages(batch_size=5000, only_unlabelled=True):
+    # Yields lists of (email, chat_id, idx, content) for user messages,
+    # by default only those without a mood label yet
+    conn = _connect()
+    unlabelled = " AND mood IS NULL" if only_unlabelled else ""
+    last = ("", -1, -1)
+    while True:
+        rows = conn.execute(
+            "SELECT email, chat_id, idx, content FROM messages WHERE (email, chat_id, idx) > (?, ?, ?) "
+            f"AND role = 'user'{unlabelled} ORDER BY email, chat_id, idx LIMIT ?", (*last, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][:3]
+
+
+def set_message_moods(rows):
+    # rows: (mood, email, chat_id, idx)
+    with _transaction() as conn:
+        conn.executemany("UPDATE messages SET mood = ? WHERE email = ? AND chat_id = ? AND idx = ?", rows)
+
+
+def import_legacy(path):
+    # Merges an old users_db.pkl: missing users are added and chats are
+    # upserted by id. Nothing already in the database is deleted, and
+    # existing passwords are kept. Returns (users, chats) seen.
+    users_db = _read_legacy_pickle(path)
+    chats = 0
+    with _transaction() as conn:
+        for email, user in users_db.items():
+            conn.execute(
+                "INSERT OR IGNORE INTO users (email, password, created_at) VALUES (?, ?, ?)",
+                (email, user["password"], user.get("created_at") or datetime.now().isoformat())
+            )
+            for chat in reversed(user.get("chats", [])):
+                _save_chat(conn, email, chat)
+                chats += 1
+    return len(users_db), chats
+
+
+# Whole-database helpers, kept for scripts that still want the old dict shape
+def load_users_db():
+    conn = _connect()
+    users_db = {}
+    for email, password, created_at in conn.execute("SELECT email, password, created_at FROM users"):
+        users_db[email] = {"password": password, "chats": load_chats(email), "created_at": created_at}
+    return users_db
+
+
+def save_users_db(users_db):
+    with _transaction() as conn:
+        for email, user in users_db.items():
+            _write_user(conn, email, user)
+    return users_db
@@ -0,0 +1,173 @@
+"""Process-wide store of signed-in users' chats.
+
+Every session signed in as the same user shares one record instead of
+loading its own copy, so there is a single authoritative version of
+each user's chats in memory. Changes go through the record and bump its
+version; other sessions notice the new version on their next run and
+pick up the current chat list. Another server process can change the
+same user's chats, so a record is checked against the database every
+`check_interval` seconds and loaded again if it has fallen behind.
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+
+class UserRecord:
+
+    def __init__(self, email, chats, search_index, insights, memory):
+        self.email = email
+        self.chats = chats
+        # id -> chat, kept in step with `chats` so lookups don't scan the list
+        self.chat_index = {chat["id"]: chat for chat in chats}
+        self.last_chat_id = max(self.chat_index, default=0)
+        self.search_index = search_index
+        # Rollups as stored, plus counts not yet handed to the writer. The
+        # writer adds those to the stored rollups, so other processes'
+        # counts are never overwritten.
+        self.insights = insights
+        self.unsaved_insights = type(insights)()
+        self.memory = memory
+        self.version = 0
+        self.lock = threading.RLock()
+        self.checked_at = time.monotonic()
+
+    def touch(self):
+        with self.lock:
+            self.version += 1
+            return self.version
+
+    def new_chat_id(self):
+        # Microsecond timestamps, bumped past the last id handed out, so an
+        # id is never reused even after the newest chat is deleted
+        with self.lock:
+            self.last_chat_id = max(self.last_chat_id + 1, time.time_ns() // 1000)
+            return self.last_chat_id
+
+    def add_chat(self, chat):
+        # The chat list is replaced rather than edited, so a session still
+        # drawing the old list never sees it change under it
+        with self.lock:
+            self.chats = [chat] + self.chats
+            self.chat_index[chat["id"]] = chat
+            return self.touch()
+
+    def add_chats(self, chats):
+        # Imported chats, oldest first; they go on top in one version bump.
+        # Their messages count towards insights on the chat's creation day.
+        with self.lock:
+            for chat in chats:
+                self.chat_index[chat["id"]] = chat
+                for idx, message in enumerate(chat["messages"]):
+                    self.search_index.add_message(chat["id"], idx, message["content"])
+                    self.unsaved_insights.add(message, chat.get("created_at"))
+                    self.memory.add_message(chat["id"], idx, message)
+            self.chats = chats[::-1] + self.chats
+            return self.touch()
+
+    def remove_chat(self, chat_id):
+        with self.lock:
+            chat = self.chat_index.pop(chat_id, None)
+            if chat is None:
+                return self.version
+            self.chats = [c for c in self.chats if c is not chat]
+            self.search_index.remove_chat(chat_id)
+            self.memory.remove_chat(chat_id)
+            return self.touch()
+
+    def clear(self):
+        with self.lock:
+            self.chats = []
+            self.chat_index.clear()
+            self.search_index.clear()
+            self.memory.clear()
+            return self.touch()
+
+    def append_message(self, chat, message):
+        # Appending and indexing together keeps message indices right when
+        # two sessions write to the same chat
+        with self.lock:
+            chat["messages"].append(message)
+            idx = len(chat["messages"]) - 1
+            self.search_index.add_message(chat["id"], idx, message["content"])
+            self.unsaved_insights.add(message)
+            self.memory.add_message(chat["id"], idx, message)
+            return self.touch()
+
+    def take_unsaved_insights(self):
+        # The counts since the last call, for the writer; nothing else
+        # touches the returned object
+        with self.lock:
+            unsaved, self.unsaved_insights = self.unsaved_insights, type(self.insights)()
+            self.insights.merge(unsaved)
+            return unsaved
+
+    def insights_summary(self):
+        with self.lock:
+            return type(self.insights)().merge(self.insights).merge(self.unsaved_insights).summary()
+
+
+class UserStore:
+
+    def __init__(self, loader, max_users=1000, is_stale=None, check_interval=5.0):
+        # loader(email) -> (chats, search_index, insights, memory), read from storage;
+        # is_stale(record) -> True if storage has changes the record lacks
+        self.loader = loader
+        self.max_users = max_users
+        self.is_stale = is_stale
+        self.check_interval = check_interval
+        # Records any session still holds stay reachable through _live, so
+        # there is never a second copy; _recent keeps idle users warm
+        self._live = weakref.WeakValueDictionary()
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.reloads = 0
+
+    def _due(self, record):
+        # One session per interval does the check
+        now = time.monotonic()
+        if self.is_stale is None or now - record.checked_at < self.check_interval:
+            return False
+        record.checked_at = now
+        return True
+
+    def get(self, email):
+        with self._lock:
+            record = self._live.get(email)
+            if record is not None:
+                self._remember(email, record)
+                if not self._due(record):
+                    return record
+        if record is not None and not self.is_stale(record):
+            return record
+        data = self.loader(email)
+        with self._lock:
+            # Another session may have loaded it meanwhile; theirs wins
+            current = self._live.get(email)
+            if current is None or current is record:
+                if current is None:
+                    self.loads += 1
+                else:
+                    self.reloads += 1
+                current = UserRecord(email, *data)
+                self._live[email] = current
+            self._remember(email, current)
+            return current
+
+    def _remember(self, email, record):
+        self._recent[email] = record
+        self._recent.move_to_end(email)
+        while len(self._recent) > self.max_users:
+            self._recent.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users_in_memory": len(self._live),
+                "recent_users": len(self._recent),
+                "max_users": self.max_users,
+                "loads": self.loads,
+                "reloads": self.reloads,
+            }